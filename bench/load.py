@@ -0,0 +1,75 @@
+"""Time TableModel.getData into an offscreen, sortable TableView.
+
+python bench/load.py [--filter] [rows ...]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PySide6.QtWidgets import *
+
+from mediacatalog import db, table
+from mediacatalog.settings import Settings
+from mediacatalog.utils import MAPPING
+
+
+def make_records(count):
+    records = []
+    for i in range(count):
+        record = {key: f"{key}{i}" for key in MAPPING}
+        record.update(
+            path=f"/lib/M{i}",
+            foldername=f"Movie{i} (2000)",
+            foldersize=i * 1000,
+            genre=["Drama"],
+            watched="unwatched",
+            userrating="3.5",
+            pin="",
+        )
+        records.append(record)
+    return records
+
+
+def main(sizes, title):
+    app = QApplication([])
+    with tempfile.TemporaryDirectory() as folder:
+        Settings.db = db.SqlDatabase(os.path.join(folder, "media.db"))
+        Settings.current = Settings.db.settings()
+        view = table.TableView("movies", MAPPING)
+        view.resize(1000, 600)
+        view.show()
+        app.processEvents()
+        if title:
+            filters = {
+                "fulltext": False,
+                "title": title,
+                "quality": [],
+                "rating": [],
+                "genre": [],
+                "watched": [],
+                "status": [],
+                "folder_operator": None,
+                "folder_size": None,
+            }
+            view.tableModel().apply_filters(filters)
+        for count in sizes:
+            records = make_records(count)
+            table.getData = lambda _: [dict(record) for record in records]
+            start = time.perf_counter()
+            view.tableModel().getData()
+            app.processEvents()
+            elapsed = time.perf_counter() - start
+            print(f"{count} rows: {elapsed:.2f}s, {view.model().rowCount()} shown")
+        Settings.db.close()
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    title = "title" if "--filter" in args else None
+    sizes = [int(arg) for arg in args if arg.isdigit()] or [10000, 50000]
+    main(sizes, title)
@@ -0,0 +1,70 @@
+"""Scan write and single field edit throughput.
+
+python bench/writes.py [records]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mediacatalog import db
+
+EDITS = 300
+
+
+def make_records(count):
+    records = []
+    for i in range(count):
+        records.append(
+            {
+                "foldername": f"Movie{i} (2000)",
+                "path": f"/lib/Movie{i} (2000)",
+                "foldersize": i * 1000,
+                "images": [f"/lib/Movie{i}/poster.jpg", f"/lib/Movie{i}/fanart.jpg"],
+                "image_cached": [f"/c/{i}a.jpg", f"/c/{i}b.jpg"],
+                "videofiles": [f"/lib/Movie{i}/movie.mkv"],
+                "nfopath": None,
+                "title": f"Movie {i}",
+                "plot": "x" * 200,
+                "runtime": "120",
+                "userrating": "3.5",
+                "genre": ["Drama", "Action", "Comedy"],
+                "year": "2000",
+                "watched": "unwatched",
+                "status": "Active",
+                "comments": "",
+                "quality": "",
+                "pin": "",
+                "lastviewed": "",
+                "playcount": 0,
+            }
+        )
+    return records
+
+
+def main(count):
+    records = make_records(count)
+    with tempfile.TemporaryDirectory() as folder:
+        database = db.SqlDatabase(os.path.join(folder, "media.db"))
+        database.fingerprints = db.Fingerprints(database.conn)
+        database.images = db.ImageCache(database.imagedir, database.conn)
+        report = db.new_report(False)
+        start = time.perf_counter()
+        for i in range(0, count, db.SCAN_BATCH):
+            batch = records[i : i + db.SCAN_BATCH]
+            database.write_batch("movies", {}, batch, {}, False, report, None)
+        elapsed = time.perf_counter() - start
+        print(f"scan writes: {count} records, {count / elapsed:.0f} records/s")
+        start = time.perf_counter()
+        for record in records[:EDITS]:
+            database.updateField("movies", record["path"], "comments", "edited")
+        elapsed = time.perf_counter() - start
+        print(f"updateField: {EDITS} edits, {EDITS / elapsed:.0f} edits/s")
+        database.close()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
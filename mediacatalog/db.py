@@ -3,14 +3,20 @@ import json
 import os
 import shutil
 import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from copy import deepcopy
 from hashlib import md5
 
 from PySide6.QtCore import *
 from PySide6.QtGui import *
 from PySide6.QtWidgets import *
 
+from mediacatalog.images import IMAGE_DIR, make_thumbnails
 from mediacatalog.settings import Settings, setting
-from mediacatalog.utils import MAPPING, nfo_to_dict, tv_nfo_to_dict
+from mediacatalog.utils import MAPPING, folder_value, nfo_to_dict, tv_nfo_to_dict
 
 
 class Diff:
@@ -18,326 +24,1167 @@ class Diff:
     missing_content = []
 
 
-def get_folder_size(path):
-    total = 0
-    if os.path.isfile(path):
-        return os.path.getsize(path)
-    elif os.path.isdir(path):
-        for filename in os.listdir(path):
-            fullpath = os.path.join(path, filename)
-            total += get_folder_size(fullpath)
-    return total
-
-
-def find_image_files(path):
-    paths = []
-    if os.path.isfile(path) and os.path.splitext(path)[-1].lower() in [
-        ".jpg",
-        ".png",
-        ".jpeg",
-        ".tiff",
-        ".gif",
+IMAGE_EXTENSIONS = [".jpg", ".png", ".jpeg", ".tiff", ".gif"]
+VIDEO_EXTENSIONS = [".avi", ".mkv", ".mp4", ".mov", ".wmv"]
+SCAN_BATCH = 50
+HASH_CHUNK = 1024 * 1024
+DB_CACHE_KIB = 16 * 1024
+DB_MMAP_BYTES = 128 * 1024 * 1024
+FOLDER_FIELDS = ["foldersize", "images", "image_cached", "nfopath", "videofiles"]
+USER_FIELDS = [
+    "watched",
+    "playcount",
+    "lastviewed",
+    "userrating",
+    "comments",
+    "quality",
+    "pin",
+    "resolution",
+    "dateadded",
+    "status",
+]
+TABLES = ["movies", "tv", "ufc", "documentaries"]
+TITLE_COLUMNS = {
+    "foldername": "TEXT NOT NULL",
+    "title": "TEXT",
+    "plot": "TEXT",
+    "runtime": "INTEGER",
+    "userrating": "TEXT",
+    "tagline": "TEXT",
+    "mpaa": "TEXT",
+    "playcount": "INTEGER",
+    "imdb": "TEXT",
+    "country": "TEXT",
+    "director": "TEXT",
+    "premiered": "TEXT",
+    "year": "INTEGER",
+    "trailer": "TEXT",
+    "studio": "TEXT",
+    "dateadded": "TEXT",
+    "status": "TEXT",
+    "comments": "TEXT",
+    "quality": "TEXT",
+    "resolution": "TEXT",
+    "lastviewed": "TEXT",
+    "watched": "TEXT",
+    "pin": "INTEGER",
+    "nfopath": "TEXT",
+    "foldersize": "INTEGER",
+    "foldertitle": "TEXT",
+    "folderyear": "TEXT",
+    "folderimdb": "TEXT",
+}
+EPISODE_COLUMNS = {
+    "season": "INTEGER",
+    "episodetitle": "TEXT",
+    "episodenumber": "INTEGER",
+    "episoderating": "TEXT",
+    "watched": "TEXT",
+    "playcount": "INTEGER",
+    "lastviewed": "TEXT",
+    "dateadded": "TEXT",
+    "pin": "INTEGER",
+    "resolution": "TEXT",
+}
+CHILD_FIELDS = ["genre", "images", "image_cached", "videofiles", "seasons"]
+INDEXED_COLUMNS = ["foldername", "title", "userrating", "quality", "watched", "status"]
+SEARCH_COLUMNS = ["title", "plot", "tagline", "director", "studio", "comments"]
+SEARCH_RANK = "bm25(10.0, 1.0, 2.0, 2.0, 2.0, 1.0)"
+SORT_EXPRESSIONS = {
+    "title": "coalesce(nullif(titles.title, ''), "
+    "folder_value(titles.foldername, 'title'))",
+    "year": "coalesce(nullif(nullif(titles.year, ''), 0), "
+    "CAST(nullif(folder_value(titles.foldername, 'year'), '') AS INTEGER))",
+    "path": "titles.path",
+    "genre": "(SELECT group_concat(genre, '  ') FROM genres "
+    "WHERE genres.path = titles.path)",
+}
+
+
+def lower_text(text):
+    return text.lower() if isinstance(text, str) else text
+
+
+def connect(path):
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute(f"PRAGMA cache_size = -{DB_CACHE_KIB}")
+    conn.execute(f"PRAGMA mmap_size = {DB_MMAP_BYTES}")
+    conn.execute("PRAGMA foreign_keys = ON")
+    # SQLite's lower() only folds ASCII; match str.lower used in memory.
+    conn.create_function("lower_text", 1, lower_text, deterministic=True)
+    conn.create_function("folder_value", 2, folder_value, deterministic=True)
+    return conn
+
+
+def remove_database(path):
+    for name in [path, f"{path}-wal", f"{path}-shm"]:
+        if os.path.exists(name):
+            os.remove(name)
+
+
+def create_schema(cursor):
+    columns = ", ".join(f"{name} {kind}" for name, kind in TITLE_COLUMNS.items())
+    cursor.execute(
+        "CREATE TABLE titles(path TEXT PRIMARY KEY, kind TEXT NOT NULL, "
+        f"{columns}, extra TEXT NOT NULL DEFAULT '{{}}')"
+    )
+    for column in INDEXED_COLUMNS + ["foldersize"]:
+        cursor.execute(f"CREATE INDEX titles_{column} ON titles(kind, {column})")
+    cursor.execute(
+        "CREATE TABLE genres(path TEXT NOT NULL REFERENCES titles ON DELETE CASCADE, "
+        "genre TEXT NOT NULL, PRIMARY KEY(path, genre))"
+    )
+    cursor.execute("CREATE INDEX genres_genre ON genres(genre)")
+    cursor.execute(
+        "CREATE TABLE images(path TEXT NOT NULL REFERENCES titles ON DELETE CASCADE, "
+        "position INTEGER NOT NULL, image TEXT NOT NULL, cached TEXT, "
+        "PRIMARY KEY(path, position))"
+    )
+    cursor.execute(
+        "CREATE TABLE videofiles(path TEXT NOT NULL "
+        "REFERENCES titles ON DELETE CASCADE, position INTEGER NOT NULL, "
+        "file TEXT NOT NULL, PRIMARY KEY(path, position))"
+    )
+    cursor.execute(
+        "CREATE TABLE seasons(show TEXT NOT NULL REFERENCES titles ON DELETE CASCADE, "
+        "name TEXT NOT NULL, PRIMARY KEY(show, name))"
+    )
+    columns = ", ".join(f"{name} {kind}" for name, kind in EPISODE_COLUMNS.items())
+    cursor.execute(
+        "CREATE TABLE episodes(path TEXT PRIMARY KEY, show TEXT NOT NULL, "
+        f"seasonname TEXT NOT NULL, {columns}, extra TEXT NOT NULL DEFAULT '{{}}', "
+        "FOREIGN KEY(show, seasonname) REFERENCES seasons ON DELETE CASCADE)"
+    )
+    cursor.execute("CREATE INDEX episodes_show ON episodes(show, seasonname)")
+    cursor.execute("CREATE INDEX episodes_lastviewed ON episodes(lastviewed)")
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS fingerprints"
+        "(path PRIMARY KEY, mtime, entries, size)"
+    )
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS imagehashes" "(path PRIMARY KEY, size, mtime, hash)"
+    )
+
+
+def migrate_json_tables(cursor):
+    """Move rows from the old `(path, foldername, json)` tables into `titles`."""
+    create_schema(cursor)
+    for table in TABLES:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name = ?",
+            (table,),
+        )
+        if cursor.fetchone() is None:
+            continue
+        rows = cursor.execute(f"SELECT json FROM {table}").fetchall()
+        write_records(cursor, table, [json.loads(row[0]) for row in rows])
+        cursor.execute(f"DROP TABLE {table}")
+
+
+def migrate_settings_rows(cursor):
+    """Split the single settings document into one row per key."""
+    cursor.execute(
+        "CREATE TABLE settings_rows(key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+    )
+    cursor.execute("SELECT name FROM sqlite_master WHERE name = 'settings'")
+    if cursor.fetchone() is not None:
+        cursor.execute("SELECT value FROM settings WHERE key = 'settings'")
+        row = cursor.fetchone()
+        if row is not None:
+            cursor.executemany(
+                "INSERT INTO settings_rows VALUES(?, ?)",
+                [(key, json.dumps(value)) for key, value in json.loads(row[0]).items()],
+            )
+        cursor.execute("DROP TABLE settings")
+    cursor.execute("ALTER TABLE settings_rows RENAME TO settings")
+
+
+def search_values(table, row):
+    """SQL expressions for the searchable text of `row`, a row of `table`."""
+    if table == "titles":
+        return [f"{row}.{column}" for column in SEARCH_COLUMNS]
+    return [f"{row}.episodetitle"] + [
+        f"json_extract({row}.extra, '$.{column}')" for column in SEARCH_COLUMNS[1:]
+    ]
+
+
+def migrate_search_index(cursor):
+    """Index the text of titles and episodes in contentless FTS5 tables."""
+    columns = ", ".join(SEARCH_COLUMNS)
+    for table, watched in [("titles", columns), ("episodes", "episodetitle, extra")]:
+        fts = f"{table}_search"
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE {fts} USING fts5({columns}, content='', "
+            "tokenize='unicode61 remove_diacritics 2')"
+        )
+        cursor.execute(
+            f"INSERT INTO {fts}({fts}, rank) VALUES('rank', ?)", (SEARCH_RANK,)
+        )
+        new, old = search_values(table, "new"), search_values(table, "old")
+        insert = (
+            f"INSERT INTO {fts}(rowid, {columns}) VALUES(new.rowid, {', '.join(new)});"
+        )
+        delete = (
+            f"INSERT INTO {fts}({fts}, rowid, {columns}) "
+            f"VALUES('delete', old.rowid, {', '.join(old)});"
+        )
+        changed = " OR ".join(f"{a} IS NOT {b}" for a, b in zip(old, new))
+        cursor.execute(
+            f"CREATE TRIGGER {fts}_insert AFTER INSERT ON {table} BEGIN {insert} END"
+        )
+        cursor.execute(
+            f"CREATE TRIGGER {fts}_delete AFTER DELETE ON {table} BEGIN {delete} END"
+        )
+        cursor.execute(
+            f"CREATE TRIGGER {fts}_update AFTER UPDATE OF {watched} ON {table} "
+            f"WHEN {changed} BEGIN {delete} {insert} END"
+        )
+        cursor.execute(
+            f"INSERT INTO {fts}(rowid, {columns}) "
+            f"SELECT rowid, {', '.join(search_values(table, table))} FROM {table}"
+        )
+
+
+def search_query(text):
+    """Turn free text into an FTS5 query matching all of its words."""
+    words = text.split()
+    query = ['"{}"'.format(word.replace('"', '""')) for word in words]
+    if words and len(words[-1]) > 1:
+        query[-1] += "*"
+    return " ".join(query)
+
+
+def filter_query(kind, filters, matches=None):
+    """Translate toolbar filters into a `FROM ... WHERE ...` over `titles`."""
+    source, where, params = "titles", ["kind = ?"], [kind]
+    order = "titles.rowid"
+    if filters is None:
+        return f"{source} WHERE {where[0]}", params, order
+    if filters["fulltext"] and filters["title"]:
+        source = (
+            "json_each(?) AS ranked CROSS JOIN titles ON titles.path = ranked.value"
+        )
+        params.insert(0, json.dumps(matches or []))
+        order = "ranked.key"
+    elif filters["title"]:
+        where.append("instr(lower_text(coalesce(title, '')), ?) > 0")
+        params.append(filters["title"].lower())
+    for column, key in [
+        ("quality", "quality"),
+        ("userrating", "rating"),
+        ("watched", "watched"),
+        ("status", "status"),
     ]:
-        paths.append(path)
-        return paths
-    elif os.path.isdir(path):
-        for filename in os.listdir(path):
-            fullpath = os.path.join(path, filename)
-            paths += find_image_files(fullpath)
-    return paths
+        if filters[key]:
+            where.append(f"{column} IN ({', '.join('?' * len(filters[key]))})")
+            params += filters[key]
+    if filters["genre"]:
+        where.append(
+            "titles.path IN (SELECT path FROM genres "
+            f"WHERE genre IN ({', '.join('?' * len(filters['genre']))}))"
+        )
+        params += filters["genre"]
+    if filters["folder_operator"] and filters["folder_size"]:
+        # Same sense as the in-memory filter: the operator hides matching rows.
+        operator = {"=": "=", ">": "<=", "<": ">="}[filters["folder_operator"]]
+        where.append(f"foldersize {operator} ?")
+        params.append(int(filters["folder_size"]))
+    return f"{source} WHERE {' AND '.join(where)}", params, order
 
 
-def find_nfo(path):
-    if not os.path.isdir(path):
-        return None
-    for item in os.listdir(path):
-        if os.path.splitext(item)[-1].lower() == ".nfo":
-            return os.path.join(path, item)
-    return None
+# Schema version N is reached by running MIGRATIONS[N - 1].
+MIGRATIONS = [migrate_json_tables, migrate_settings_rows, migrate_search_index]
+
+
+class SettingsStore:
+    """All settings, read once and written back one key at a time."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.dirty = {}
+        self.values = deepcopy(Settings.default)
+        for key, value in conn.execute("SELECT key, value FROM settings"):
+            self.values[key] = json.loads(value)
+
+    def get(self, key):
+        return self.values[key]
+
+    def set(self, key, value):
+        self.update({key: value})
+
+    def defer(self, key, value):
+        self.values[key] = value
+        self.dirty[key] = value
+
+    def flush(self):
+        if self.dirty:
+            self.update(dict(self.dirty))
+
+    def update(self, values):
+        self.values.update(values)
+        for key in values:
+            self.dirty.pop(key, None)
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO settings VALUES(?, ?)",
+            [(key, json.dumps(value)) for key, value in values.items()],
+        )
+        self.conn.commit()
+
+
+def write_records(cursor, table, records):
+    names = ", ".join(TITLE_COLUMNS)
+    updates = ", ".join(f"{name} = excluded.{name}" for name in TITLE_COLUMNS)
+    cursor.executemany(
+        f"INSERT INTO titles(path, kind, {names}, extra) "
+        f"VALUES(?, ?, {', '.join('?' * len(TITLE_COLUMNS))}, ?) "
+        f"ON CONFLICT(path) DO UPDATE SET {updates}, extra = excluded.extra",
+        [title_row(table, record) for record in records],
+    )
+    for key in ["genre", "images", "videofiles"]:
+        write_children(cursor, key, {i["path"]: i.get(key) for i in records})
+    cursor.executemany(
+        "UPDATE images SET cached = ? WHERE path = ? AND position = ?",
+        [
+            (cached, record["path"], i)
+            for record in records
+            for i, cached in enumerate(record.get("image_cached", []))
+        ],
+    )
+    for record in records:
+        if "seasons" in record:
+            write_seasons(cursor, record["path"], record["seasons"])
+
+
+def title_row(table, record):
+    extra = {
+        key: value
+        for key, value in record.items()
+        if key not in TITLE_COLUMNS and key not in CHILD_FIELDS and key != "path"
+    }
+    values = [record.get(name) for name in TITLE_COLUMNS]
+    return [record["path"], table, *values, json.dumps(extra)]
+
+
+def child_list(value):
+    """Child values as a list; old rows can hold a single string."""
+    if not value:
+        return []
+    if isinstance(value, str):
+        return [value]
+    return value
+
+
+def write_children(cursor, key, values):
+    paths = [(path,) for path in values]
+    if key == "genre":
+        cursor.executemany("DELETE FROM genres WHERE path = ?", paths)
+        cursor.executemany(
+            "INSERT OR IGNORE INTO genres VALUES(?, ?)",
+            [(path, i) for path, genres in values.items() for i in child_list(genres)],
+        )
+    elif key == "images":
+        cursor.executemany("DELETE FROM images WHERE path = ?", paths)
+        cursor.executemany(
+            "INSERT INTO images VALUES(?, ?, ?, NULL)",
+            [
+                (path, i, image)
+                for path, images in values.items()
+                for i, image in enumerate(child_list(images))
+            ],
+        )
+    elif key == "videofiles":
+        cursor.executemany("DELETE FROM videofiles WHERE path = ?", paths)
+        cursor.executemany(
+            "INSERT INTO videofiles VALUES(?, ?, ?)",
+            [
+                (path, i, video)
+                for path, videos in values.items()
+                for i, video in enumerate(child_list(videos))
+            ],
+        )
+
+
+def write_seasons(cursor, show, seasons):
+    cursor.executemany(
+        "INSERT OR IGNORE INTO seasons VALUES(?, ?)",
+        [(show, name) for name in seasons],
+    )
+    rows = []
+    for name, episodes in seasons.items():
+        for episode in episodes:
+            rows.append(episode_row(show, name, episode))
+    if rows:
+        names = ", ".join(EPISODE_COLUMNS)
+        updates = ", ".join(f"{name} = excluded.{name}" for name in EPISODE_COLUMNS)
+        cursor.executemany(
+            f"INSERT INTO episodes(path, show, seasonname, {names}, extra) "
+            f"VALUES(?, ?, ?, {', '.join('?' * len(EPISODE_COLUMNS))}, ?) "
+            f"ON CONFLICT(path) DO UPDATE SET {updates}, extra = excluded.extra",
+            rows,
+        )
+
+
+def episode_row(show, name, episode):
+    extra = {
+        key: value
+        for key, value in episode.items()
+        if key not in EPISODE_COLUMNS and key != "path"
+    }
+    values = [episode.get(column) for column in EPISODE_COLUMNS]
+    return [episode["path"], show, name, *values, json.dumps(extra)]
+
+
+def set_field(cursor, path, key, value, episode=False, kind=None):
+    """Update one field of the title or episode at `path` in place."""
+    table, columns = "titles", TITLE_COLUMNS
+    if episode:
+        table, columns = "episodes", EPISODE_COLUMNS
+    elif kind is not None:
+        cursor.execute("SELECT 1 FROM titles WHERE path = ? AND kind = ?", (path, kind))
+        if cursor.fetchone() is None:
+            return
+    if key in columns:
+        cursor.execute(f"UPDATE {table} SET {key} = ? WHERE path = ?", (value, path))
+    elif not episode and key == "seasons":
+        write_seasons(cursor, path, value)
+    elif not episode and key in CHILD_FIELDS:
+        write_children(cursor, key, {path: value})
+    else:
+        cursor.execute(
+            f"UPDATE {table} SET extra = json_set(extra, ?, json(?)) WHERE path = ?",
+            (f'$."{key}"', json.dumps(value), path),
+        )
+
+
+def read_records(conn, table, paths=None, seasons=True):
+    """Rebuild the records of `table`, or only those in `paths`."""
+    where = "kind = ?"
+    params = [table]
+    if paths is not None:
+        # The unary + keeps the planner on the primary key rather than a
+        # (kind, ...) index that matches every row of the table.
+        where = f"+kind = ? AND titles.path IN ({', '.join('?' * len(paths))})"
+        params += list(paths)
+    cursor = conn.execute(f"SELECT * FROM titles WHERE {where} ORDER BY rowid", params)
+    names = [column[0] for column in cursor.description]
+    records = {}
+    for row in cursor:
+        record = dict(zip(names, row))
+        del record["kind"]
+        record.update(json.loads(record.pop("extra")))
+        record["genre"] = []
+        record["images"] = []
+        record["videofiles"] = []
+        records[record["path"]] = record
+    for path, genre in conn.execute(
+        "SELECT genres.path, genre FROM genres JOIN titles USING(path) "
+        f"WHERE {where} ORDER BY genres.rowid",
+        params,
+    ):
+        records[path]["genre"].append(genre)
+    for path, image, cached in conn.execute(
+        "SELECT images.path, image, cached FROM images JOIN titles USING(path) "
+        f"WHERE {where} ORDER BY images.path, position",
+        params,
+    ):
+        records[path]["images"].append(image)
+        if cached is not None:
+            records[path].setdefault("image_cached", []).append(cached)
+    for path, video in conn.execute(
+        "SELECT videofiles.path, file FROM videofiles JOIN titles USING(path) "
+        f"WHERE {where} ORDER BY videofiles.path, position",
+        params,
+    ):
+        records[path]["videofiles"].append(video)
+    if table == "tv" and seasons:
+        for record in records.values():
+            record["seasons"] = {}
+        shows = ""
+        if paths is not None:
+            shows = f"WHERE show IN ({', '.join('?' * len(paths))})"
+        for show, name in conn.execute(
+            f"SELECT show, name FROM seasons {shows} ORDER BY rowid", params[1:]
+        ):
+            records[show]["seasons"][name] = []
+        for show, name, episode in read_episodes(conn, shows, params[1:]):
+            records[show]["seasons"][name].append(episode)
+    return records
+
+
+def known_episodes(conn):
+    """Map every show to its seasons and the episode paths stored for them."""
+    known = {}
+    for (show,) in conn.execute("SELECT path FROM titles WHERE kind = 'tv'"):
+        known[show] = {}
+    for show, name in conn.execute("SELECT show, name FROM seasons"):
+        known[show][name] = set()
+    for show, name, path in conn.execute("SELECT show, seasonname, path FROM episodes"):
+        known[show][name].add(path)
+    return known
+
+
+def read_episodes(conn, where="", params=()):
+    cursor = conn.execute(
+        f"SELECT * FROM episodes {where} ORDER BY episodes.rowid", params
+    )
+    names = [column[0] for column in cursor.description]
+    for row in cursor:
+        episode = dict(zip(names, row))
+        show = episode.pop("show")
+        name = episode.pop("seasonname")
+        episode.update(json.loads(episode.pop("extra")))
+        yield show, name, episode
+
+
+class Fingerprints:
+    """Last seen (mtime, entries, size) of every scanned directory."""
+
+    def __init__(self, conn):
+        self.prints = {}
+        self.children = {}
+        for path, mtime, entries, size in conn.execute("SELECT * FROM fingerprints"):
+            self.add(path, (mtime, entries, size))
+
+    def add(self, path, fingerprint):
+        if path not in self.prints:
+            self.children.setdefault(os.path.dirname(path), []).append(path)
+        self.prints[path] = fingerprint
+
+    def size(self, path):
+        return self.prints[path][2]
+
+    def unchanged(self, path):
+        stack = [path]
+        while stack:
+            current = stack.pop()
+            if current not in self.prints:
+                return False
+            try:
+                mtime = os.stat(current).st_mtime_ns
+            except OSError:
+                return False
+            if mtime != self.prints[current][0]:
+                return False
+            stack.extend(self.children.get(current, []))
+        return True
+
+    def discard(self, path):
+        """Forget `path` and every directory below it, returning them all."""
+        parent = os.path.dirname(path)
+        self.children[parent] = [i for i in self.children.get(parent, []) if i != path]
+        removed = []
+        stack = [path]
+        while stack:
+            current = stack.pop()
+            if self.prints.pop(current, None) is not None:
+                removed.append(current)
+            stack.extend(self.children.pop(current, []))
+        return removed
+
+    def save(self, cursor, prints):
+        """Store rewalked fingerprints; `None` marks a directory skipped as unchanged."""
+        walked = {path: value for path, value in prints.items() if value is not None}
+        stale = []
+        for path in walked:
+            for child in self.children.get(path, []):
+                if child not in prints:
+                    stale += self.discard(child)
+        cursor.executemany(
+            "DELETE FROM fingerprints WHERE path = ?", [(path,) for path in stale]
+        )
+        for path, fingerprint in walked.items():
+            self.add(path, fingerprint)
+        cursor.executemany(
+            "INSERT OR REPLACE INTO fingerprints VALUES(?, ?, ?, ?)",
+            [(path, *fingerprint) for path, fingerprint in walked.items()],
+        )
+
+
+class ImageCache:
+    """Content addressed copies of library images in `imagedir`."""
+
+    def __init__(self, imagedir, conn, rehash=False):
+        self.imagedir = imagedir
+        self.hashes = {}
+        self.pending = {}
+        self.lock = threading.Lock()
+        if rehash:
+            return
+        for path, size, mtime, digest in conn.execute("SELECT * FROM imagehashes"):
+            self.hashes[path] = (size, mtime, digest)
+
+    def digest(self, path, size, mtime):
+        known = self.hashes.get(path)
+        if known is not None and known[:2] == (size, mtime):
+            return known[2]
+        digest = hash_file(path)
+        with self.lock:
+            self.pending[path] = (size, mtime, digest)
+        return digest
+
+    def cache(self, record, imagestats):
+        record["image_cached"] = []
+        for img in record["images"]:
+            if img in imagestats:
+                size, mtime = imagestats[img]
+            else:
+                stat = os.stat(img)
+                size, mtime = stat.st_size, stat.st_mtime_ns
+            ext = os.path.splitext(img)[-1]
+            loc = os.path.join(self.imagedir, self.digest(img, size, mtime) + ext)
+            if not os.path.exists(loc):
+                link_or_copy(img, loc)
+            make_thumbnails(loc)
+            record["image_cached"].append(loc)
+
+    def save(self, cursor):
+        with self.lock:
+            pending = self.pending
+            self.pending = {}
+        self.hashes.update(pending)
+        cursor.executemany(
+            "INSERT OR REPLACE INTO imagehashes VALUES(?, ?, ?, ?)",
+            [(path, *value) for path, value in pending.items()],
+        )
+
+
+def hash_file(path):
+    digest = md5()
+    with open(path, "rb") as infile:
+        for chunk in iter(lambda: infile.read(HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+        return
+    except FileExistsError:
+        return
+    except OSError:
+        pass
+    # Copies of the same image may run at once; each writes its own file.
+    handle, partial = tempfile.mkstemp(suffix=".part", dir=os.path.dirname(dst))
+    os.close(handle)
+    try:
+        shutil.copy(src, partial)
+        try:
+            os.replace(partial, dst)
+        except OSError:
+            if not os.path.exists(dst):
+                raise
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+
+
+def walk_folder(path, fingerprints=None):
+    """Collect size, images, videos and nfo for `path` in a single pass."""
+    scan = {
+        "foldersize": 0,
+        "images": [],
+        "videofiles": [],
+        "nfopath": None,
+        "nfomtime": None,
+        "subdirs": {},
+        "fingerprints": {},
+        "imagestats": {},
+    }
+    if os.path.isdir(path):
+        mtime = os.stat(path).st_mtime_ns
+        scan["foldersize"] = _walk(path, mtime, scan, 0, None, fingerprints)
+    elif os.path.isfile(path):
+        scan["foldersize"] = os.path.getsize(path)
+        if os.path.splitext(path)[-1].lower() in IMAGE_EXTENSIONS:
+            scan["images"].append(path)
+        scan["videofiles"] = None
+    return scan
+
+
+def _walk(path, mtime, scan, depth, listing, fingerprints):
+    size = 0
+    count = 0
+    with os.scandir(path) as entries:
+        for entry in entries:
+            count += 1
+            if entry.is_dir():
+                if depth == 0:
+                    sublisting = scan["subdirs"].setdefault(entry.name, [])
+                else:
+                    sublisting = None
+                if fingerprints is not None and fingerprints.unchanged(entry.path):
+                    size += fingerprints.size(entry.path)
+                    scan["fingerprints"][entry.path] = None
+                    continue
+                submtime = entry.stat().st_mtime_ns
+                size += _walk(
+                    entry.path, submtime, scan, depth + 1, sublisting, fingerprints
+                )
+            elif entry.is_file():
+                stat = entry.stat()
+                size += stat.st_size
+                ext = os.path.splitext(entry.name)[-1].lower()
+                if ext in IMAGE_EXTENSIONS:
+                    scan["images"].append(entry.path)
+                    scan["imagestats"][entry.path] = (stat.st_size, stat.st_mtime_ns)
+                if depth == 0:
+                    if ext in VIDEO_EXTENSIONS:
+                        scan["videofiles"].append(entry.path)
+                    elif ext == ".nfo" and scan["nfopath"] is None:
+                        scan["nfopath"] = entry.path
+                        scan["nfomtime"] = stat.st_mtime_ns
+                elif listing is not None:
+                    listing.append(entry.name)
+    scan["fingerprints"][path] = (mtime, count, size)
+    return size
 
 
-def scan_videos(path):
-    video_files = []
-    if not os.path.isdir(path):
+def read_nfo(nfo):
+    if nfo is None:
         return None
-    for name in os.listdir(path):
-        if os.path.splitext(name)[-1].lower() in [
-            ".avi",
-            ".mkv",
-            ".mp4",
-            ".mov",
-            ".wmv",
-        ]:
-            video_files.append(os.path.join(path, name))
-    return video_files
-
-
-def scan_media(path, paths):
-    records = []
+    with open(nfo, "rt", encoding="utf8") as nfofile:
+        return nfofile.read()
+
+
+def folder_parts(record, item):
+    parts = item.split()
+    try:
+        record["foldertitle"] = parts[0]
+        record["folderyear"] = parts[1].strip("()")
+        record["folderimdb"] = parts[2].strip("()")
+    except IndexError:
+        pass
+
+
+def merge_record(existing, record, deep):
+    """Fold a rescan into `existing`, keeping user edits unless the nfo changed."""
+    nfomtime = record.get("nfomtime")
+    renewed = deep and nfomtime != existing.get("nfomtime", nfomtime)
+    for key, value in record.items():
+        if key in FOLDER_FIELDS:
+            pass
+        elif not deep:
+            continue
+        elif key == "nfomtime":
+            pass
+        elif key in existing and (not renewed or key in USER_FIELDS):
+            continue
+        elif value is None and existing.get(key) is not None:
+            continue
+        existing[key] = value
+    return existing
+
+
+def new_report(deep):
+    return {
+        "mode": "deep" if deep else "fast",
+        "seconds": 0.0,
+        "added": 0,
+        "updated": 0,
+        "skipped": 0,
+        "missing": 0,
+        "errors": 0,
+        "episodes": 0,
+        "cancelled": False,
+    }
+
+
+def scan_title(item, fullpath, images, fingerprints, known):
+    if known and fingerprints is not None and fingerprints.unchanged(fullpath):
+        return None, [], None
+    record = {}
+    try:
+        scan = walk_folder(fullpath)
+        record["foldername"] = item
+        record["path"] = fullpath
+        record["foldersize"] = scan["foldersize"]
+        record["images"] = scan["images"]
+        record.update(nfo_to_dict(read_nfo(scan["nfopath"])))
+        record["nfopath"] = scan["nfopath"]
+        record["nfomtime"] = scan["nfomtime"]
+        folder_parts(record, item)
+        record["videofiles"] = scan["videofiles"]
+        images.cache(record, scan["imagestats"])
+    except Exception as e:
+        print(e)
+        print(fullpath)
+        return None, [], {}
+    return record, [], scan["fingerprints"]
+
+
+def scan_media(path, paths, fingerprints, images, executor):
     if not path:
-        return records
+        return []
+    jobs = []
     for item in os.listdir(path):
-        record = {}
         fullpath = os.path.join(path, item)
-        if fullpath in paths:
-            continue
-        try:
-            record["foldername"] = item
-            record["path"] = fullpath
-            record["foldersize"] = get_folder_size(fullpath)
-            record["images"] = find_image_files(fullpath)
-            nfo = find_nfo(fullpath)
-            if nfo is not None:
-                with open(nfo, "rt", encoding="utf8") as nfofile:
-                    content = nfofile.read()
-            else:
-                content = None
-            record.update(nfo_to_dict(content))
-            record["nfopath"] = nfo
-            parts = item.split()
-            try:
-                record["foldertitle"] = parts[0]
-                record["folderyear"] = parts[1].strip("()")
-                record["folderimdb"] = parts[2].strip("()")
-            except IndexError:
-                pass
-            record["videofiles"] = scan_videos(fullpath)
-            records.append(record)
-        except Exception as e:
-            print(e)
-            print(fullpath)
-    return records
+        known = fullpath in paths
+        jobs.append(
+            executor.submit(scan_title, item, fullpath, images, fingerprints, known)
+        )
+    return jobs
+
+
+def scan_show(folder, folderpath, known, fingerprints):
+    """Scan a show folder, keeping only the episodes missing from `known`."""
+    new = []
+    record = {"foldername": folder, "path": folderpath}
+    try:
+        if known is not None and fingerprints is not None:
+            if fingerprints.unchanged(folderpath):
+                return None, new, None
+            scan = walk_folder(folderpath, fingerprints)
+            record["foldersize"] = scan["foldersize"]
+        else:
+            scan = walk_folder(folderpath)
+            record["foldersize"] = scan["foldersize"]
+            record["images"] = scan["images"]
+            folder_parts(record, folder)
+            record.update(tv_nfo_to_dict(read_nfo(scan["nfopath"])))
+            record["nfopath"] = scan["nfopath"]
+            record["nfomtime"] = scan["nfomtime"]
+        record["seasons"] = {}
+        scan_seasons(record, folderpath, scan["subdirs"], new, known or {})
+    except Exception as e:
+        print(e)
+        print(folderpath)
+        return None, [], {}
+    return record, new, scan["fingerprints"]
 
 
-def scan_tv_media(paths, path, new):
+def scan_tv_media(known, path, fingerprints, executor):
     if not path:
         return []
-    records = []
+    jobs = []
     for folder in os.listdir(path):
         folderpath = os.path.join(path, folder)
-        if folderpath not in paths:
-            record = {}
-            record["foldername"] = folder
-            record["path"] = folderpath
-            record["foldersize"] = get_folder_size(folderpath)
-            record["images"] = find_image_files(folderpath)
-            parts = folder.split()
-            nfo = find_nfo(folderpath)
-            try:
-                record["foldertitle"] = parts[0]
-                record["folderyear"] = parts[1].strip("()")
-                record["folderimdb"] = parts[2].strip("()")
-            except IndexError:
-                pass
-            if nfo is not None:
-                with open(nfo, "rt", encoding="utf8") as nfofile:
-                    content = nfofile.read()
-            else:
-                content = None
-            record.update(tv_nfo_to_dict(content))
-            record["nfopath"] = nfo
-            record["seasons"] = {}
-        else:
-            record = paths[folderpath]
-        scan_seasons(record, folderpath, new)
-        records.append(record)
-    return records
+        episodes = known.get(folderpath)
+        jobs.append(
+            executor.submit(scan_show, folder, folderpath, episodes, fingerprints)
+        )
+    return jobs
 
 
-def scan_seasons(record, path, new):
-    for item in os.listdir(path):
+def scan_seasons(record, path, subdirs, new, known):
+    for item, files in subdirs.items():
+        if not item.lower().startswith("season"):
+            continue
         fullpath = os.path.join(path, item)
-        if os.path.isdir(fullpath) and item.lower().startswith("season"):
-            record["seasons"].setdefault(item, [])
-            episode_paths = [i["path"] for i in record["seasons"][item]]
-            for epi in os.listdir(fullpath):
-                epi_path = os.path.join(fullpath, epi)
-                if epi_path in episode_paths:
-                    continue
-                parts = os.path.splitext(epi)[0].split("-")
-                numbers = parts[1].strip()
-                season, episode_num = numbers.lower().split("x")
-                episode = {
-                    "path": epi_path,
-                    "season": int(season),
-                    "episodetitle": parts[2].strip(),
-                    "episodenumber": int(episode_num),
-                    "episoderating": "0.0",
-                    "watched": "unwatched",
-                    "playcount": 0,
-                    "lastviewed": "",
-                    "dateadded": datetime.datetime.today().strftime("%m-%d-%Y"),
-                    "pin": False,
-                }
-                record["seasons"][item].append(episode)
-                new.append(episode)
+        record["seasons"].setdefault(item, [])
+        episode_paths = known.get(item, ())
+        for epi in files:
+            epi_path = os.path.join(fullpath, epi)
+            if epi_path in episode_paths:
+                continue
+            parts = os.path.splitext(epi)[0].split("-")
+            numbers = parts[1].strip()
+            season, episode_num = numbers.lower().split("x")
+            episode = {
+                "path": epi_path,
+                "season": int(season),
+                "episodetitle": parts[2].strip(),
+                "episodenumber": int(episode_num),
+                "episoderating": "0.0",
+                "watched": "unwatched",
+                "playcount": 0,
+                "lastviewed": "",
+                "dateadded": datetime.datetime.today().strftime("%m-%d-%Y"),
+                "pin": False,
+            }
+            record["seasons"][item].append(episode)
+            new.append(episode)
 
 
 class SqlDatabase:
     def __init__(self, path):
         self.path = path
         self.missing_content = []
-        self.imagedir = os.path.join(os.path.dirname(path), "imgs")
+        self.last_report = None
+        self.fingerprints = None
+        self.images = None
+        self.imagedir = os.path.join(os.path.dirname(path), IMAGE_DIR)
         self.setup_database(path)
-        self.conn = sqlite3.connect(path)
-        self.refresh_database()
+        self.conn = connect(path)
+        self.store = SettingsStore(self.conn)
 
     def close(self):
         self.conn.close()
 
     def settings(self):
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT * FROM settings")
-        settings_row = cursor.fetchall()
-        settings_dict = json.loads(settings_row[0][1])
-        return settings_dict
+        return self.store.values
 
     def set_settings(self, settings):
-        cursor = self.conn.cursor()
-        cursor.execute(
-            'UPDATE settings SET "value" = ? WHERE "key" = ?',
-            (json.dumps(settings), "settings"),
-        )
-        self.conn.commit()
+        self.store.update(settings)
 
     def setting(self, key):
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT value FROM settings WHERE key = ?", ("settings",))
-        val = cursor.fetchone()[0]
-        d = json.loads(val)
-        return d[key]
+        return self.store.get(key)
 
     def set_setting(self, key, value):
-        settings = self.settings()
-        settings[key] = value
-        self.set_settings(settings)
+        self.store.set(key, value)
+
+    def defer_setting(self, key, value):
+        self.store.defer(key, value)
+
+    def flush_settings(self):
+        self.store.flush()
 
     def dropRow(self, table, path):
         cursor = self.conn.cursor()
-        cursor.execute(f'DELETE FROM {table} WHERE "path" = ?', (path,))
+        cursor.execute("DELETE FROM titles WHERE path = ? AND kind = ?", (path, table))
         self.conn.commit()
 
-    def refresh_database(self, deep=False):
-        cursor = self.conn.cursor()
-        for key in ["movies", "ufc", "documentaries"]:
-            values = self.setting(key)
-            records = []
-            cursor.execute(f"SELECT * FROM {key}")
-            current = cursor.fetchall()
-            paths = []
-            for row in current:
-                path = row[0]
-                if not os.path.exists(path):
-                    self.missing_content.append(path)
-                else:
-                    paths.append(path)
-            for val in values:
-                records += scan_media(val, paths)
-            for record in records:
-                path = record["path"]
-                Diff.new_content[path] = record
-                foldername = record["foldername"]
-                record["image_cached"] = []
-                for img in record["images"]:
-                    ext = os.path.splitext(img)[-1]
-                    with open(img, "rb") as imgfile:
-                        name = md5(imgfile.read()).hexdigest()
-                    loc = os.path.join(self.imagedir, name + ext)
-                    shutil.copy(img, loc)
-                    record["image_cached"].append(loc)
-                jsondata = json.dumps(record)
-                cursor.execute(
-                    f"INSERT INTO {key} values(?, ?, ?)",
-                    (path, foldername, jsondata),
-                )
-        self.conn.commit()
-        self.refresh_tv()
+    def refresh_database(self, deep=False, progress=None, found=None, cancelled=None):
+        """Scan the library folders and return a report of what changed."""
+        start = time.perf_counter()
+        report = new_report(deep)
+        self.fingerprints = Fingerprints(self.conn)
+        self.images = ImageCache(self.imagedir, self.conn, deep)
+        check = None if deep else self.fingerprints
+        with ThreadPoolExecutor(max_workers=self.setting("scan_workers")) as executor:
+            queued = []
+            for key in ["movies", "ufc", "documentaries"]:
+                paths = self.current_paths(key, report)
+                jobs = []
+                for val in self.setting(key):
+                    jobs += scan_media(val, paths, check, self.images, executor)
+                queued.append((key, paths, jobs))
+            known = known_episodes(self.conn)
+            paths = read_records(self.conn, "tv", seasons=False)
+            jobs = []
+            for val in self.setting("tv"):
+                jobs += scan_tv_media(known, val, check, executor)
+            queued.append(("tv", paths, jobs))
+            total = sum(len(jobs) for _, _, jobs in queued)
+            done = 0
+            for key, paths, jobs in queued:
+                records = []
+                prints = {}
+                for job in jobs:
+                    if cancelled is not None and cancelled():
+                        report["cancelled"] = True
+                        break
+                    record, episodes, folderprints = job.result()
+                    done += 1
+                    if progress is not None:
+                        progress(done, total)
+                    if folderprints is None:
+                        report["skipped"] += 1
+                    elif record is None:
+                        report["errors"] += 1
+                    else:
+                        records.append(record)
+                        prints.update(folderprints)
+                        for episode in episodes:
+                            Diff.new_content[episode["path"]] = episode
+                        report["episodes"] += len(episodes)
+                    if len(records) >= SCAN_BATCH:
+                        self.write_batch(
+                            key, paths, records, prints, deep, report, found
+                        )
+                        records = []
+                        prints = {}
+                self.write_batch(key, paths, records, prints, deep, report, found)
+                if report["cancelled"]:
+                    for _, _, jobs in queued:
+                        for job in jobs:
+                            job.cancel()
+                    break
+        report["seconds"] = time.perf_counter() - start
+        self.last_report = report
+        return report
+
+    def current_paths(self, key, report):
+        paths = {}
+        for path, record in read_records(self.conn, key).items():
+            if not os.path.exists(path):
+                self.missing_content.append(path)
+                report["missing"] += 1
+            else:
+                paths[path] = record
+        return paths
 
-    def refresh_tv(self):
+    def write_batch(self, key, paths, records, prints, deep, report, found):
         cursor = self.conn.cursor()
-        values = self.setting("tv")
-        cursor.execute(f"SELECT * FROM tv")
-        current = cursor.fetchall()
-        paths = {item[0]: json.loads(item[-1]) for item in current}
-        for val in values:
-            new = []
-            records = scan_tv_media(paths, val, new)
-            for record in records:
-                jsondata = json.dumps(record)
-                if record["path"] in paths:
-                    cursor.execute(
-                        f'UPDATE tv SET "json" = ? WHERE "foldername" = ?',
-                        (jsondata, record["foldername"]),
-                    )
-                else:
-                    cursor.execute(
-                        f"INSERT INTO tv values(?, ?, ?)",
-                        (record["path"], record["foldername"], jsondata),
-                    )
-            for episode in new:
-                Diff.new_content[episode["path"]] = episode
+        stored = []
+        seasons = {}
+        for record in records:
+            path = record["path"]
+            if "seasons" in record:
+                seasons[path] = record.pop("seasons")
+            if path in paths:
+                record = merge_record(paths[path], record, deep)
+                report["updated"] += 1
+            else:
+                if key != "tv":
+                    Diff.new_content[path] = record
+                report["added"] += 1
+            stored.append(record)
+        write_records(cursor, key, stored)
+        for path, episodes in seasons.items():
+            write_seasons(cursor, path, episodes)
+        self.fingerprints.save(cursor, prints)
+        self.images.save(cursor)
         self.conn.commit()
+        if stored:
+            # Hand out the records as stored, with the column types getData has.
+            records = read_records(self.conn, key, [i["path"] for i in stored])
+            stored = list(records.values())
+        if found is not None and stored:
+            found(key, stored)
 
     def setup_database(self, path):
-        if os.path.exists(path):
-            return
         if not os.path.exists(self.imagedir):
             os.mkdir(self.imagedir)
-        con = sqlite3.connect(path)
+        con = connect(path)
         cursor = con.cursor()
-        cursor.execute("CREATE TABLE movies(path, foldername, json)")
-        cursor.execute("CREATE TABLE tv(path, foldername, json)")
-        cursor.execute("CREATE TABLE ufc(path, foldername, json)")
-        cursor.execute("CREATE TABLE documentaries(path, foldername, json)")
-        cursor.execute("CREATE TABLE settings(key, value)")
-        cursor.execute(
-            "INSERT INTO settings VALUES(?, ?)",
-            ("settings", json.dumps(Settings.default)),
-        )
-        con.commit()
+        cursor.execute("BEGIN")
+        try:
+            version = cursor.execute("PRAGMA user_version").fetchone()[0]
+            for number in range(version, len(MIGRATIONS)):
+                MIGRATIONS[number](cursor)
+                cursor.execute(f"PRAGMA user_version = {number + 1}")
+            con.commit()
+        except Exception:
+            con.rollback()
+            raise
+        finally:
+            con.close()
 
-    def updateField(self, table, foldername, key, value):
-        cursor = self.conn.cursor()
-        cursor.execute(f"SELECT * FROM {table} WHERE foldername = ?", (foldername,))
-        row = cursor.fetchone()
-        jsondata = row[-1]
-        record = json.loads(jsondata)
-        record[key] = value
-        jsondata = json.dumps(record)
-        cursor.execute(
-            f'UPDATE {table} SET "json" = ? WHERE "foldername" = ?',
-            (jsondata, foldername),
-        )
+    def updateField(self, table, path, key, value):
+        set_field(self.conn.cursor(), path, key, value, kind=table)
+        self.conn.commit()
+
+    def updateFields(self, table, changes):
+        """Apply `(path, key, value)` changes in a single transaction."""
+        with self.conn:
+            cursor = self.conn.cursor()
+            for path, key, value in changes:
+                set_field(cursor, path, key, value, kind=table)
+
+    def updateEpisode(self, path, key, value):
+        set_field(self.conn.cursor(), path, key, value, episode=True)
         self.conn.commit()
 
+    def updateEpisodes(self, changes):
+        with self.conn:
+            cursor = self.conn.cursor()
+            for path, key, value in changes:
+                set_field(cursor, path, key, value, episode=True)
+
     def getData(self, table):
-        cursor = self.conn.cursor()
-        cursor.execute(f"SELECT * FROM {table}")
-        return cursor.fetchall()
+        return list(read_records(self.conn, table).values())
+
+    def countRows(self, table):
+        cursor = self.conn.execute(
+            "SELECT count(*) FROM titles WHERE kind = ?", (table,)
+        )
+        return cursor.fetchone()[0]
+
+    def getRecords(self, table, paths):
+        """The records of `paths`, in the same order."""
+        records = read_records(self.conn, table, paths)
+        return [records[path] for path in paths if path in records]
+
+    def queryPaths(self, table, filters=None, column=None, descending=False):
+        """The paths of the rows of `table` passing `filters`."""
+        clause, params, order = filter_query(
+            table, filters, self.matches(table, filters)
+        )
+        if column in TITLE_COLUMNS or column in SORT_EXPRESSIONS:
+            expression = SORT_EXPRESSIONS.get(column, f"titles.{column}")
+            direction = "DESC" if descending else "ASC"
+            order = f"{expression} {direction}, titles.rowid {direction}"
+        cursor = self.conn.execute(
+            f"SELECT titles.path FROM {clause} ORDER BY {order}", params
+        )
+        return [row[0] for row in cursor]
+
+    def matches(self, table, filters):
+        if filters is None or not (filters["fulltext"] and filters["title"]):
+            return None
+        return self.search(table, filters["title"])
+
+    def search(self, kind, text):
+        """Paths matching `text`, best match first."""
+        query = search_query(text)
+        if not query:
+            return []
+        titles = (
+            "SELECT titles.path AS path, titles_search.rank AS score "
+            "FROM titles_search JOIN titles ON titles.rowid = titles_search.rowid "
+            "WHERE titles_search MATCH ? AND titles.kind = ?"
+        )
+        episodes = (
+            "SELECT episodes.{} AS path, episodes_search.rank AS score "
+            "FROM episodes_search JOIN episodes "
+            "ON episodes.rowid = episodes_search.rowid "
+            "WHERE episodes_search MATCH ?"
+        )
+        if kind == "episode":
+            sql, params = episodes.format("path"), [query]
+        elif kind == "tv":
+            sql = f"{titles} UNION ALL {episodes.format('show')}"
+            params = [query, kind, query]
+        else:
+            sql, params = titles, [query, kind]
+        cursor = self.conn.execute(
+            f"SELECT path FROM ({sql}) GROUP BY path ORDER BY min(score)", params
+        )
+        return [row[0] for row in cursor]
 
     def getRecent(self):
         cursor = self.conn.cursor()
         results = []
-        for table in ["movies", "ufc", "documentaries"]:
-            cursor.execute(f"SELECT * FROM {table}")
-            for row in cursor.fetchall():
-                data = json.loads(row[-1])
-                if data["lastviewed"]:
-                    dt = datetime.datetime.strptime(data["lastviewed"], "%m-%d-%Y")
+        cursor.execute(
+            "SELECT kind, path FROM titles WHERE kind != 'tv' AND lastviewed != ''"
+        )
+        wanted = {}
+        for table, path in cursor.fetchall():
+            wanted.setdefault(table, set()).add(path)
+        for table, paths in wanted.items():
+            for path, data in read_records(self.conn, table).items():
+                if path in paths:
                     data["table"] = table
-                    data["dt"] = dt
                     results.append(data)
-        cursor.execute(f"SELECT * FROM tv")
-        for row in cursor.fetchall():
-            data = json.loads(row[-1])
-            for season in data["seasons"]:
-                for episode in data["seasons"][season]:
-                    if episode["lastviewed"]:
-                        dt = datetime.datetime.strptime(
-                            episode["lastviewed"], "%m-%d-%Y"
-                        )
-                        episode["table"] = "tv"
-                        episode["dt"] = dt
-                        episode["foldername"] = data["foldername"]
-                        results.append(episode)
+        episodes = read_episodes(
+            self.conn,
+            "JOIN (SELECT path AS show, foldername FROM titles) USING(show) "
+            "WHERE lastviewed != ''",
+        )
+        for _, _, episode in episodes:
+            episode["table"] = "tv"
+            results.append(episode)
+        for data in results:
+            data["dt"] = datetime.datetime.strptime(data["lastviewed"], "%m-%d-%Y")
         return sorted(results, key=lambda x: x["dt"], reverse=True)
+
+
+class ScanWorker(QThread):
+    progress = Signal(int, int)
+    recordsFound = Signal(str, object)
+    scanFinished = Signal(object)
+
+    def __init__(self, path, deep=False, parent=None):
+        super().__init__(parent=parent)
+        self.path = path
+        self.deep = deep
+
+    def run(self):
+        db = SqlDatabase(self.path)
+        try:
+            report = db.refresh_database(
+                self.deep,
+                self.progress.emit,
+                self.recordsFound.emit,
+                self.isInterruptionRequested,
+            )
+        except Exception as e:
+            print(e)
+            report = new_report(self.deep)
+            report["errors"] += 1
+        finally:
+            db.close()
+        self.scanFinished.emit(report)
@@ -0,0 +1,181 @@
+import os
+import tempfile
+from collections import OrderedDict
+
+from PySide6.QtCore import *
+from PySide6.QtGui import *
+
+IMAGE_DIR = "imgs"
+THUMBNAIL_SIZES = [256, 512, 1024]
+IMAGE_CACHE_BYTES = 96 * 1024 * 1024
+IMAGE_LOAD_THREADS = 2
+SCALED_CACHE_ENTRIES = 16
+
+_loader = None
+
+
+def thumbnail_path(image, size):
+    """Thumbnails live in `thumbs/<size>/` next to the `imgs/` cache."""
+    root = os.path.dirname(os.path.dirname(image))
+    name = os.path.splitext(os.path.basename(image))[0]
+    return os.path.join(root, "thumbs", str(size), name + ".jpg")
+
+
+def save_thumbnail(thumb, path):
+    """Write `thumb` through a temporary file of its own, then move it to `path`.
+
+    Titles sharing an image are scanned at the same time, so another
+    thread may write the same thumbnail first; that counts as success.
+    """
+    folder = os.path.dirname(path)
+    os.makedirs(folder, exist_ok=True)
+    handle, partial = tempfile.mkstemp(suffix=".part", dir=folder)
+    os.close(handle)
+    try:
+        if not thumb.save(partial, "JPG", 90):
+            raise OSError(f"Could not write {path}")
+        try:
+            os.replace(partial, path)
+        except OSError:
+            if not os.path.exists(path):
+                raise
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+
+
+def make_thumbnails(image):
+    """Write the missing thumbnails of `image`, never failing the scan."""
+    source = None
+    for size in THUMBNAIL_SIZES:
+        path = thumbnail_path(image, size)
+        if os.path.exists(path):
+            continue
+        if source is None:
+            source = QImage(image)
+            if source.isNull():
+                return
+        if max(source.width(), source.height()) <= size:
+            return
+        thumb = source.scaled(
+            size,
+            size,
+            Qt.AspectRatioMode.KeepAspectRatio,
+            Qt.TransformationMode.SmoothTransformation,
+        )
+        try:
+            save_thumbnail(thumb, path)
+        except OSError as e:
+            print(e)
+            return
+
+
+def thumbnail_for(image, width, height):
+    """Return the smallest thumbnail of `image` that covers width x height.
+
+    Only images in the local `imgs/` cache have thumbnails; anything else,
+    such as the uncached TV images on the library share, is used as is.
+    """
+    if os.path.basename(os.path.dirname(image)) != IMAGE_DIR:
+        return image
+    needed = max(width, height)
+    for size in THUMBNAIL_SIZES:
+        if size >= needed:
+            path = thumbnail_path(image, size)
+            if os.path.exists(path):
+                return path
+    return image
+
+
+class LruImageCache:
+    """Decoded images, evicting the least recently used past `limit` bytes."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.size = 0
+        self.images = OrderedDict()
+
+    def get(self, path):
+        image = self.images.get(path)
+        if image is not None:
+            self.images.move_to_end(path)
+        return image
+
+    def put(self, path, image):
+        if path in self.images:
+            self.size -= self.images.pop(path).sizeInBytes()
+        self.images[path] = image
+        self.size += image.sizeInBytes()
+        while self.size > self.limit and len(self.images) > 1:
+            _, oldest = self.images.popitem(last=False)
+            self.size -= oldest.sizeInBytes()
+
+
+class ScaledPixmapCache:
+    """Smoothly scaled pixmaps keyed by (source, width, height)."""
+
+    def __init__(self, limit=SCALED_CACHE_ENTRIES):
+        self.limit = limit
+        self.pixmaps = OrderedDict()
+
+    def get(self, key):
+        pixmap = self.pixmaps.get(key)
+        if pixmap is not None:
+            self.pixmaps.move_to_end(key)
+        return pixmap
+
+    def put(self, key, pixmap):
+        self.pixmaps[key] = pixmap
+        self.pixmaps.move_to_end(key)
+        while len(self.pixmaps) > self.limit:
+            self.pixmaps.popitem(last=False)
+
+
+class ImageLoadTask(QRunnable):
+    def __init__(self, path, loader):
+        super().__init__()
+        self.path = path
+        self.loader = loader
+
+    def run(self):
+        self.loader.decoded.emit(self.path, QImage(self.path))
+
+
+class ImageLoader(QObject):
+    """Decodes images on a thread pool and keeps them in an LRU cache."""
+
+    imageLoaded = Signal(str, QImage)
+    decoded = Signal(str, QImage)
+
+    def __init__(self, limit=IMAGE_CACHE_BYTES, parent=None):
+        super().__init__(parent=parent)
+        self.cache = LruImageCache(limit)
+        self.pending = set()
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(IMAGE_LOAD_THREADS)
+        self.decoded.connect(self.onDecoded)
+
+    def request(self, path):
+        image = self.cache.get(path)
+        if image is None and path not in self.pending:
+            self.pending.add(path)
+            self.pool.start(ImageLoadTask(path, self))
+        return image
+
+    def prefetch(self, paths):
+        for path in paths:
+            self.request(path)
+
+    def onDecoded(self, path, image):
+        self.pending.discard(path)
+        if image.isNull():
+            return
+        self.cache.put(path, image)
+        self.imageLoaded.emit(path, image)
+
+
+def image_loader():
+    global _loader
+    if _loader is None:
+        _loader = ImageLoader()
+    return _loader
@@ -1,4 +1,3 @@
-import random
 import shutil
 import subprocess
 import webbrowser
@@ -11,10 +10,14 @@ from PySide6.QtGui import *
 from PySide6.QtWidgets import *
 
 from mediacatalog import utils
-from mediacatalog.settings import dropRow, setSetting, setting, updateField
+from mediacatalog.images import ScaledPixmapCache, image_loader, thumbnail_for
+from mediacatalog.settings import (deferSetting, dropRow, setting,
+                                   updateEpisodes, updateFields)
 from mediacatalog.table import ListView, TableView
 from mediacatalog.utils import EPISODE, MAPPING, geticon
 
+FILTER_DELAY_MS = 200
+
 
 def reverse_mapping(field, mapping=MAPPING):
     for k, v in mapping.items():
@@ -40,12 +43,24 @@ _media_mapping = list(utils.MAPPING.items())
 
 class MediaProfile(QWidget):
     fieldChanged = Signal(str, str)
+    fieldsChanged = Signal(object)
 
     def __init__(self, table, mapping=_media_mapping, parent=None):
         super().__init__(parent=parent)
         self._mapping = mapping
         self._table = table
         self.images = None
+        self._source = None
+        self._current = None
+        self._currentPixmap = None
+        self._pixmapFor = None
+        self._loader = image_loader()
+        self._loader.imageLoaded.connect(self.onImageLoaded)
+        self._scaled = ScaledPixmapCache()
+        self._settleTimer = QTimer(self)
+        self._settleTimer.setSingleShot(True)
+        self._settleTimer.setInterval(150)
+        self._settleTimer.timeout.connect(self.scaleLabel)
         self.layout = QVBoxLayout(self)
         self.label = DoubleClickLabel()
         self.label.setSizePolicy(
@@ -89,9 +104,13 @@ class MediaProfile(QWidget):
         return self._section
 
     def onWatched(self):
-        self.fieldChanged.emit("Watched", "watched")
-        self.fieldChanged.emit("Play Count", "1")
-        self.fieldChanged.emit("Last Viewed", datetime.today().strftime("%m-%d-%Y"))
+        self.fieldsChanged.emit(
+            [
+                ("Watched", "watched"),
+                ("Play Count", "1"),
+                ("Last Viewed", datetime.today().strftime("%m-%d-%Y")),
+            ]
+        )
 
     def onFieldChanged(self, field, value):
         self.fieldChanged.emit(field, value)
@@ -101,21 +120,62 @@ class MediaProfile(QWidget):
             index = self.images.index(self._current)
             if index + 1 < len(self.images):
                 self._current = self.images[index + 1]
-                self._currentPixmap = QPixmap(self._current)
             else:
                 self._current = self.images[0]
-                self._currentPixmap = QPixmap(self._current)
             self.scaleLabel()
 
-    def scaleLabel(self):
-        self.label.setPixmap(
-            self._currentPixmap.scaled(
+    def loadPixmap(self):
+        source = thumbnail_for(self._current, self.label.width(), self.label.height())
+        if source == self._source:
+            return
+        self._source = source
+        image = self._loader.request(source)
+        if image is not None:
+            self._currentPixmap = QPixmap.fromImage(image)
+            self._pixmapFor = self._current
+        elif self._pixmapFor != self._current:
+            self._currentPixmap = None
+            self.label.clear()
+
+    def onImageLoaded(self, path, image):
+        if path == self._source:
+            self._currentPixmap = QPixmap.fromImage(image)
+            self._pixmapFor = self._current
+            self.scaleLabel()
+
+    def prefetch(self, rows):
+        paths = []
+        for data in rows:
+            if "image_cached" in data:
+                images = data["image_cached"]
+            else:
+                images = data.get("images")
+            if images:
+                image = images[1] if len(images) > 1 else images[0]
+                width, height = self.label.width(), self.label.height()
+                paths.append(thumbnail_for(image, width, height))
+        self._loader.prefetch(paths)
+
+    def scaleLabel(self, fast=False):
+        self.loadPixmap()
+        if self._currentPixmap is None:
+            return
+        key = (self._source, self.label.width(), self.label.height())
+        pixmap = self._scaled.get(key)
+        if pixmap is None:
+            if fast:
+                mode = Qt.TransformationMode.FastTransformation
+            else:
+                mode = Qt.TransformationMode.SmoothTransformation
+            pixmap = self._currentPixmap.scaled(
                 self.label.width(),
                 self.label.height(),
                 Qt.AspectRatioMode.KeepAspectRatio,
-                Qt.TransformationMode.SmoothTransformation,
+                mode,
             )
-        )
+            if not fast:
+                self._scaled.put(key, pixmap)
+        self.label.setPixmap(pixmap)
 
     def setCurrent(self, data):
         for k,v in self.fields.items():
@@ -129,8 +189,6 @@ class MediaProfile(QWidget):
             self.images = data["images"]
         if self.images:
             self._current = self.images[0]
-            self._currentPixmap = QPixmap(self.images[0])
-            self.label.setPixmap(self._currentPixmap)
             self.label.setScaledContents(False)
             self.switchImage()
         for key, value in data.items():
@@ -145,7 +203,8 @@ class MediaProfile(QWidget):
     def resizeEvent(self, event):
         self.label.setFixedHeight(int(self.height() * 0.45))
         if self.images:
-            self.scaleLabel()
+            self.scaleLabel(fast=True)
+            self._settleTimer.start()
         self.scrollWidget.setFixedWidth(self.scrollarea.viewport().width())
         super().resizeEvent(event)
 
@@ -184,6 +243,12 @@ class ToolBar(QToolBar):
         self.title_line = QLineEdit()
         self.title_line.setMaximumWidth(100)
         self.filter_toolbar.addWidget(self.title_line)
+        self.fulltext_action = QAction("Full Text", self)
+        self.fulltext_action.setCheckable(True)
+        self.fulltext_action.setToolTip(
+            "Search title, plot, tagline, director, studio and comments"
+        )
+        self.filter_toolbar.addAction(self.fulltext_action)
         self.filter_toolbar.addSeparator()
         self.quality = QToolButton()
         self.quality.setProperty("class", "filter")
@@ -238,11 +303,16 @@ class ToolBar(QToolBar):
         self.addAction(self.recent_list_action)
         self.delete_action = QAction(geticon("trash"), "Delete", self)
         self.addAction(self.delete_action)
+        self.filterTimer = QTimer(self)
+        self.filterTimer.setSingleShot(True)
+        self.filterTimer.setInterval(FILTER_DELAY_MS)
+        self.filterTimer.timeout.connect(self.somethingChanged)
         self.setupMenus()
         self.setupSignals()
 
     def on_reset(self):
         self.title_line.clear()
+        self.fulltext_action.setChecked(False)
         for action in self.quality_action_group.actions():
             if action.isChecked():
                 action.setChecked(False)
@@ -262,10 +332,11 @@ class ToolBar(QToolBar):
         self.onChange()
 
     def onChange(self, *args):
-        self.somethingChanged.emit()
+        self.filterTimer.start()
 
     def setupSignals(self):
         self.title_line.textChanged.connect(self.onChange)
+        self.fulltext_action.toggled.connect(self.onChange)
         for action in self.quality_action_group.actions():
             action.toggled.connect(self.onChange)
         for action in self.genre_action_group.actions():
@@ -294,6 +365,7 @@ class ToolBar(QToolBar):
         folder_size = self.folder_size_value.value()
         return {
             "title": title,
+            "fulltext": self.fulltext_action.isChecked(),
             "quality": quality,
             "rating": rating,
             "genre": genre,
@@ -411,7 +483,7 @@ class MediaPage(QWidget):
         self.set_count_label()
 
     def set_count_label(self):
-        rows = self.table.tableModel().rowCount(None)
+        rows = self.table.tableModel().total()
         self.count_label.setText(f"Count: {rows}")
 
 
@@ -441,36 +513,38 @@ class MediaPage(QWidget):
     def addMediaProfile(self):
         self.mediaProfile = MediaProfile(self._table, parent=self)
         self.mediaProfile.fieldChanged.connect(self.onFieldChanged)
+        self.mediaProfile.fieldsChanged.connect(self.onFieldsChanged)
         self.splitter.addWidget(self.mediaProfile)
         self.table.selectRow(0)
 
     def onFieldChanged(self, field, value):
+        self.onFieldsChanged([(field, value)])
+
+    def onFieldsChanged(self, changes):
         current = self.table.selectionModel().currentIndex()
         row = self.table.model().mapToSource(current)
         data = self.table.tableModel().getRow(row)
-        foldername = data["foldername"]
-        key = reverse_mapping(field)
-        updateField(self._table, foldername, key, value)
-        data[key] = value
+        changes = [(reverse_mapping(field), value) for field, value in changes]
+        updateFields(self._table, [(data["path"], k, v) for k, v in changes])
+        for key, value in changes:
+            self.table.tableModel().setField(data, key, value)
         self.table.tableModel().dataChanged.emit(row, row)
 
     def updateSplitterSizes(self, *args):
-        setSetting(f"{self._table}mediaslider", self.splitter.sizes())
-        setSetting(f"{self._table}toolbarslider", self.splitter2.sizes())
+        deferSetting(f"{self._table}mediaslider", self.splitter.sizes())
+        deferSetting(f"{self._table}toolbarslider", self.splitter2.sizes())
 
     def onRowChanged(self, current, previous):
         row = self.table.model().mapToSource(current)
         row = self.table.tableModel().getRow(row)
         self.mediaProfile.setCurrent(row)
+        self.mediaProfile.prefetch(self.table.neighbours(current))
 
     def go_to_settings(self):
         self.toSettings.emit()
 
     def random_sort_table(self):
-        self.table.model().setRandom()
-        i = random.choice(range(self.table.model().columnCount()))
-        self.table.model().sort(i,Qt.SortOrder.AscendingOrder)
-        self.table.model().setRandom()
+        self.table.shuffle()
 
 
 class TvPage(QWidget):
@@ -538,6 +612,7 @@ class TvPage(QWidget):
     def addMediaProfile(self):
         self.mediaProfile = TvMediaProfile("tv", parent=self)
         self.mediaProfile.fieldChanged.connect(self.onFieldChanged)
+        self.mediaProfile.fieldsChanged.connect(self.onFieldsChanged)
         self.splitter.addWidget(self.mediaProfile)
         self.table.selectRow(0)
 
@@ -553,26 +628,34 @@ class TvPage(QWidget):
         row = self.table.tableModel().getRow(current)
         self.seasons.setSeasons(row["seasons"].keys())
         self.mediaProfile.setCurrent(row)
+        self.mediaProfile.prefetch(self.table.neighbours(current))
 
     def onEpisodeSelected(self, current, previous):
         row = self.episode_table.tableModel().getRow(current)
         self.mediaProfile.setCurrent(row)
 
     def updateSplitterSizes(self, *args):
-        setSetting(f"tvmediaslider", self.splitter.sizes())
-        setSetting(f"tvtoolbarslider", self.splitter2.sizes())
+        deferSetting(f"tvmediaslider", self.splitter.sizes())
+        deferSetting(f"tvtoolbarslider", self.splitter2.sizes())
 
     def go_to_settings(self):
         self.toSettings.emit()
 
     def onFieldChanged(self, field, value):
+        self.onFieldsChanged([(field, value)])
+
+    def onFieldsChanged(self, changes):
         current = self.table.selectionModel().currentIndex()
         row = self.table.model().mapToSource(current)
         data = self.table.tableModel().getRow(row)
-        foldername = data["foldername"]
-        key = reverse_mapping(field, mapping=utils.TV_MAPPING)
-        if not key:
-            key = reverse_mapping(field, mapping=EPISODE)
+        shows, episodes = [], []
+        for field, value in changes:
+            key = reverse_mapping(field, mapping=utils.TV_MAPPING)
+            if key:
+                shows.append((key, value))
+            else:
+                episodes.append((reverse_mapping(field, mapping=EPISODE), value))
+        if episodes:
             season_text = self.seasons.current()
             season_data = data["seasons"][season_text]
             episode = self.episode_table.selectionModel().currentIndex()
@@ -580,16 +663,19 @@ class TvPage(QWidget):
             episode_data = self.episode_table.tableModel().getRow(episode_row)
             for record in season_data:
                 if record["path"] == episode_data["path"]:
-                    record[key] = value
-                    episode_data[key] = value
+                    for key, value in episodes:
+                        record[key] = value
+                        self.episode_table.tableModel().setField(
+                            episode_data, key, value
+                        )
                     break
-            updateField("tv", foldername, "seasons", data["seasons"])
-            self.table.tableModel().dataChanged.emit(row, row)
+            updateEpisodes([(episode_data["path"], k, v) for k, v in episodes])
             self.episode_table.tableModel().dataChanged.emit(episode, episode)
-        else:
-            updateField("tv", foldername, key, value)
-            data[key] = value
-            self.table.tableModel().dataChanged.emit(row, row)
+        if shows:
+            updateFields("tv", [(data["path"], k, v) for k, v in shows])
+            for key, value in shows:
+                self.table.tableModel().setField(data, key, value)
+        self.table.tableModel().dataChanged.emit(row, row)
 
 
 class Watched(QWidget):
@@ -646,16 +732,14 @@ class RatingWidget(QWidget):
         self._labels = []
 
     def clearWidget(self):
-        for i in range(self._layout.count()):
-            item = self._layout.takeAt(i)
-            if item and item.widget():
-                item.widget().deleteLater()
-        if self._widget_layout is not None:
-            for i in range(self._widget_layout.count()):
-                item = self._widget_layout.takeAt(i)
-                if item and item.widget():
-                    item.widget().deleteLater()
+        # Rows without a rating never call setText, so this may run again
+        # after the widget was already deleted.
+        if self._widget is None:
+            return
+        self._layout.removeWidget(self._widget)
         self._widget.deleteLater()
+        self._widget = None
+        self._widget_layout = None
         self._labels = []
 
     def setText(self, text):
@@ -734,7 +818,9 @@ class GenreWidget(QWidget):
         self._widget_layout = QHBoxLayout(self._widget)
         self._widget_layout.setContentsMargins(0, 0, 0, 0)
         self._widget_layout.setSpacing(0)
-        if isinstance(text, str):
+        if text is None:
+            text = []
+        elif isinstance(text, str):
             text = [text]
         for item in text:
             label = QLabel(item)
@@ -1081,7 +1167,7 @@ class FieldWidget(QWidget):
     def clear(self):
         if self._field == "Pin":
             self.line.setPixmap(QPixmap())
-        elif self._field == "Rating":
+        elif self._field in ["Rating", "Episode Rating"]:
             self.line.clearWidget()
         else:
             self.line.clear()
@@ -1,5 +1,4 @@
 import json
-import os
 from pathlib import Path
 
 from PySide6.QtCore import *
@@ -7,7 +6,11 @@ from PySide6.QtGui import *
 from PySide6.QtWidgets import *
 
 from mediacatalog import utils
-from mediacatalog.utils import EPISODE, GENRES, MAPPING, QUALITY, geticon
+from mediacatalog.utils import (EPISODE, GENRES, MAPPING, QUALITY, format_report,
+                                geticon)
+
+
+SETTINGS_FLUSH_MS = 1000
 
 
 class Settings:
@@ -36,9 +39,12 @@ class Settings:
         "moviesmediaslider": [900, 353],
         "ufcmediaslider": [900, 353],
         "tvmediaslider": [],
+        "scan_workers": 8,
+        "sqlmodelrows": 100000,
     }
     current = None
     db = None
+    timer = None
 
 
 def setting(key):
@@ -46,18 +52,62 @@ def setting(key):
 
 
 def setSetting(key, value):
-    Settings.current[key] = value
-    Settings.db.set_settings(Settings.current)
+    Settings.db.set_setting(key, value)
+
+
+def deferSetting(key, value):
+    """Change `key` now but only write it once changes stop for a moment."""
+    Settings.db.defer_setting(key, value)
+    if Settings.timer is None:
+        Settings.timer = QTimer()
+        Settings.timer.setSingleShot(True)
+        Settings.timer.setInterval(SETTINGS_FLUSH_MS)
+        Settings.timer.timeout.connect(flushSettings)
+    Settings.timer.start()
+
+
+def flushSettings():
+    if Settings.timer is not None:
+        Settings.timer.stop()
+    Settings.db.flush_settings()
+
+
+def updateField(table, path, key, value):
+    Settings.db.updateField(table, path, key, value)
+
+
+def updateFields(table, changes):
+    Settings.db.updateFields(table, changes)
+
+
+def updateEpisode(path, key, value):
+    Settings.db.updateEpisode(path, key, value)
 
 
-def updateField(table, foldername, key, value):
-    Settings.db.updateField(table, foldername, key, value)
+def updateEpisodes(changes):
+    Settings.db.updateEpisodes(changes)
 
 
 def getData(table):
     return Settings.db.getData(table)
 
 
+def fullTextSearch(kind, text):
+    return Settings.db.search(kind, text)
+
+
+def countRows(table):
+    return Settings.db.countRows(table)
+
+
+def getRecords(table, paths):
+    return Settings.db.getRecords(table, paths)
+
+
+def queryPaths(table, filters=None, column=None, descending=False):
+    return Settings.db.queryPaths(table, filters, column, descending)
+
+
 def dropRow(table, path):
     Settings.db.dropRow(table, path)
 
@@ -215,6 +265,7 @@ class SettingsWidget(QWidget):
     toHome = Signal()
     somethingChanged = Signal()
     databaseReset = Signal()
+    refreshRequested = Signal(bool)
 
     def __init__(self, db, parent=None):
         super().__init__(parent=parent)
@@ -228,6 +279,13 @@ class SettingsWidget(QWidget):
         self.deep_reset_checkbox = QCheckBox("Deep Refresh Mode")
         self.reset_database_button = QPushButton("Reset Database")
         self.refresh_database_button = QPushButton("Refresh Database")
+        self.refresh_report = QLabel()
+        self.refresh_report.setWordWrap(True)
+        self.scan_workers = QSpinBox()
+        self.scan_workers.setRange(1, 64)
+        self.scan_workers.setValue(setting("scan_workers"))
+        self.scan_workers.setPrefix("Scan Workers: ")
+        self.scan_workers.valueChanged.connect(self.onScanWorkersChanged)
         self.movies_box = GroupBox("Movies", self)
         self.tv_box = GroupBox("TV", self)
         self.ufc_box = GroupBox("UFC", self)
@@ -257,6 +315,8 @@ class SettingsWidget(QWidget):
         vlayout4.addWidget(self.reset_database_button)
         vlayout4.addWidget(self.refresh_database_button)
         vlayout4.addWidget(self.deep_reset_checkbox)
+        vlayout4.addWidget(self.refresh_report)
+        vlayout4.addWidget(self.scan_workers)
         vlayout4.addWidget(self.genres)
         vlayout4.addWidget(self.quality)
         vlayout2.addWidget(self.moviesprofile)
@@ -285,22 +345,23 @@ class SettingsWidget(QWidget):
         Settings.current = db.settings()
 
     def onResetDatabase(self):
-        os.remove(Settings.db.path)
         self.databaseReset.emit()
 
     def onRefreshDatabase(self):
-        if self.deep_reset_checkbox.isChecked():
-            Settings.db.refresh_database(deep=True)
-        else:
-            Settings.db.refresh_database()
-        self.somethingChanged.emit()
+        self.refreshRequested.emit(self.deep_reset_checkbox.isChecked())
+
+    def setReport(self, report):
+        self.refresh_report.setText(format_report(report))
+
+    def onScanWorkersChanged(self, value):
+        deferSetting("scan_workers", value)
 
     def update_settings(self, *args):
         if len(args) == 2:
             key, value = args
             if value:
                 setSetting(key, value)
-        Settings.db.refresh_database()
+        self.refreshRequested.emit(False)
         self.somethingChanged.emit()
 
 
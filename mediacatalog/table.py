@@ -1,5 +1,5 @@
-import json
 import random
+from itertools import islice
 
 import humanfriendly
 from PySide6.QtCore import *
@@ -7,8 +7,9 @@ from PySide6.QtGui import *
 from PySide6.QtWidgets import *
 
 from mediacatalog.db import Diff
-from mediacatalog.settings import getData, setSetting, setting
-from mediacatalog.utils import geticon
+from mediacatalog.settings import (countRows, deferSetting, fullTextSearch,
+                                   getData, getRecords, queryPaths, setting)
+from mediacatalog.utils import folder_value, geticon
 
 
 class ListView(QTreeView):
@@ -80,8 +81,98 @@ class ListModel(QAbstractListModel):
         self.endRemoveRows()
 
 
+INDEXED_FIELDS = ["genre", "quality", "userrating", "watched", "status", "titlekey"]
+FILTER_THREAD_ROWS = 20000
+FETCH_ROWS = 256
+SHUFFLE = "shuffle"
+
+
+def title_key(record):
+    record["titlekey"] = (record.get("title") or "").lower()
+
+
+def sort_key(record, field):
+    """Typed key ordering `field` as shown: numbers, then text, then blanks."""
+    value = record.get(field)
+    if not value and field in ["title", "year"]:
+        value = folder_value(record["foldername"], field)
+    if isinstance(value, list):
+        value = "  ".join(value)
+    if value is None or value == "":
+        return (2, "")
+    if value in ["true", "false"]:
+        return (0, float(value == "true"))
+    try:
+        return (0, float(value))
+    except (TypeError, ValueError):
+        return (1, str(value))
+
+
+def trigrams(text):
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+def compile_filters(filters):
+    """Split the toolbar values into index lookups and filtering passes."""
+    selections = []
+    for field, key in [
+        ("quality", "quality"),
+        ("userrating", "rating"),
+        ("watched", "watched"),
+        ("status", "status"),
+        ("genre", "genre"),
+    ]:
+        if filters[key]:
+            selections.append((field, set(filters[key])))
+    passes = []
+    if filters["folder_operator"] and filters["folder_size"]:
+        operator = filters["folder_operator"]
+        size = int(filters["folder_size"])
+        if operator == "=":
+            passes.append(
+                lambda records: [i for i in records if int(i["foldersize"]) == size]
+            )
+        elif operator == ">":
+            passes.append(
+                lambda records: [i for i in records if int(i["foldersize"]) <= size]
+            )
+        elif operator == "<":
+            passes.append(
+                lambda records: [i for i in records if int(i["foldersize"]) >= size]
+            )
+    if filters["fulltext"]:
+        return selections, passes, "", filters["title"]
+    return selections, passes, (filters["title"] or "").lower(), ""
+
+
+def index_values(record, field):
+    if field == "genre":
+        return record.get(field) or []
+    if field == "titlekey":
+        return trigrams(record[field])
+    return [record.get(field)]
+
+
+class FilterTask(QRunnable):
+    def __init__(self, model, request, generation):
+        super().__init__()
+        self.model = model
+        self.request = request
+        self.generation = generation
+
+    def run(self):
+        try:
+            records = self.model.filtered(self.request, self.generation)
+        except Exception as e:
+            print(e)
+            records = None
+        self.model.filtersReady.emit(self.request, self.generation, records)
+
+
 class TableModel(QAbstractTableModel):
     rowCountChanged = Signal()
+    filtersReady = Signal(int, int, object)
+
     def __init__(self, table, mapping, fields=None, parent=None, view=None):
         super().__init__(parent=parent)
         self._view = view
@@ -91,6 +182,24 @@ class TableModel(QAbstractTableModel):
         self._reverse = {v: k for k, v in mapping.items()}
         self._headers_labels = setting(self._fields + "columnfields")
         self._last_filters = None
+        self._selections = []
+        self._passes = []
+        self._title = ""
+        self._titles = None
+        self._search = ""
+        self._ranked = None
+        self._sort = None
+        self._keys = {}
+        self._stale = False
+        self._seed = None
+        self._random = random.Random()
+        self._request = 0
+        self._generation = 0
+        self._pool = QThreadPool(self)
+        self._pool.setMaxThreadCount(1)
+        self.filtersReady.connect(self.onFiltered)
+        self._index = {}
+        self._rowids = {}
         self._headers = [self._mapping[k] for k in self._headers_labels]
         self._master = []
         self._data = []
@@ -101,54 +210,188 @@ class TableModel(QAbstractTableModel):
         return self._headers
 
     def apply_filters(self, filters=None):
-        if filters is None and self._last_filters is None:
+        """Filter and sort `_master` into `_data`."""
+        if filters is None and self._last_filters is None and self._sort is None:
             return
-        if filters is None:
-            filters = self._last_filters
-        data = []
-        for record in self._master:
-            try:
-                if (
-                    filters["title"]
-                    and filters["title"].lower() not in record["title"].lower()
-                ):
-                    continue
-            except:
-                continue
-            if filters["quality"] and record["quality"] not in filters["quality"]:
-                continue
-            if filters["rating"] and record["userrating"] not in filters["rating"]:
-                continue
-            found = False
-            if filters["genre"]:
-                for genre in record["genre"]:
-                    if genre in filters["genre"]:
-                        found = True
-                        break
-            else:
-                found = True
-            if not found:
-                continue
-            if filters["watched"] and record["watched"] not in filters["watched"]:
-                continue
-            if filters["status"] and record["status"] not in filters["status"]:
-                continue
-            if filters["folder_operator"] and filters["folder_size"]:
-                operator = filters["folder_operator"]
-                size = filters["folder_size"]
-                record_size = record["foldersize"]
-                if operator == "=" and int(size) != int(record_size):
-                    continue
-                elif operator == ">" and int(size) < int(record_size):
-                    continue
-                elif operator == "<" and int(size) > int(record_size):
-                    continue
-            data.append(record)
+        if filters is not None:
+            if filters == self._last_filters:
+                return
+            self._last_filters = filters
+            self._selections, self._passes, self._title, self._search = (
+                compile_filters(filters)
+            )
+        self._ranked = self.searchRows(self._search) if self._search else None
+        self._request += 1
+        if len(self._master) < FILTER_THREAD_ROWS:
+            self.setFiltered(self.filtered())
+            return
+        self._pool.clear()
+        self._pool.start(FilterTask(self, self._request, self._generation))
+
+    def onFiltered(self, request, generation, records):
+        if request != self._request:
+            return
+        if generation != self._generation:
+            self.apply_filters()
+        elif records is not None:
+            self.setFiltered(records)
+
+    def setFiltered(self, records):
         self.beginResetModel()
-        self._data = data
+        self._data = self.sortRecords(records)
         self.endResetModel()
         self.rowCountChanged.emit()
 
+    def sort(self, column, order=Qt.SortOrder.AscendingOrder):
+        """Reorder `_data` by the precomputed keys of `column`."""
+        key = None
+        if column >= 0:
+            key = (self._headers_labels[column], order == Qt.SortOrder.DescendingOrder)
+        if key == self._sort:
+            return
+        self._sort = key
+        self.relayout()
+
+    def clearSort(self):
+        self._sort = None
+
+    def shuffle(self, seed=None):
+        """Show the rows in a random order, the same one for a given seed."""
+        self._seed = random.random() if seed is None else seed
+        self._keys.pop(SHUFFLE, None)
+        self._sort = (SHUFFLE, False)
+        self.relayout()
+
+    def relayout(self):
+        """Reorder `_data` for the current sort, keeping persistent indexes."""
+        self.layoutAboutToBeChanged.emit()
+        old = self.persistentIndexList()
+        held = [self._data[index.row()] for index in old]
+        if self._sort is None:
+            self._data = self.filtered()
+        else:
+            self._data = self.sortRecords(self._data)
+        if old:
+            rows = {id(record): row for row, record in enumerate(self._data)}
+            self.changePersistentIndexList(
+                old,
+                [
+                    self.index(rows[id(record)], index.column())
+                    if id(record) in rows
+                    else QModelIndex()
+                    for index, record in zip(old, held)
+                ],
+            )
+        self.layoutChanged.emit()
+
+    def sortRecords(self, records):
+        if self._sort is None:
+            return records
+        field, descending = self._sort
+        keys, rowids = self.sortKeys(field), self._rowids
+        ranks = [keys[rowids[record["path"]]] for record in records]
+        order = sorted(range(len(records)), key=ranks.__getitem__, reverse=descending)
+        return [records[row] for row in order]
+
+    def sortKeys(self, field):
+        """Sort keys of `field` by row id, computed on first use."""
+        keys = self._keys.get(field)
+        if keys is None:
+            if field == SHUFFLE:
+                keys = list(range(len(self._master)))
+                self._random = random.Random(self._seed)
+                self._random.shuffle(keys)
+            else:
+                keys = [sort_key(record, field) for record in self._master]
+            self._keys[field] = keys
+        return keys
+
+    def updateSortKeys(self, row, record):
+        for field, keys in self._keys.items():
+            if field == SHUFFLE:
+                # New rows land in one of the len(keys) + 1 gaps at random.
+                if row >= len(keys):
+                    keys.append(self._random.uniform(-1, len(keys)))
+            elif row < len(keys):
+                keys[row] = sort_key(record, field)
+            else:
+                keys.append(sort_key(record, field))
+
+    def filtered(self, request=None, generation=None):
+        """Records of `_master` passing the filters, or None once `request` is stale."""
+        if generation is None:
+            generation = self._generation
+        master, index = self._master, self._index
+        selections, passes, title = self._selections, self._passes, self._title
+        ranked = self._ranked
+        rows = None
+        for field, values in selections:
+            postings = index[field]
+            matched = set().union(*[postings.get(value, ()) for value in values])
+            rows = matched if rows is None else rows & matched
+        if title:
+            matched = self.titleRows(title, generation)
+            rows = matched if rows is None else rows & matched
+        if ranked is not None:
+            records = [master[row] for row in ranked if rows is None or row in rows]
+        elif rows is None:
+            records = list(master)
+        else:
+            records = [master[row] for row in sorted(rows)]
+        for narrow in passes:
+            if request is not None and request != self._request:
+                return None
+            records = narrow(records)
+        return records
+
+    def titleRows(self, title, generation):
+        """Row ids whose title contains `title`."""
+        cached = self._titles
+        if cached is not None and cached[0] == generation and cached[1] in title:
+            candidates = cached[2]
+        elif len(title) >= 3:
+            postings = sorted(
+                (self._index["titlekey"].get(gram, set()) for gram in trigrams(title)),
+                key=len,
+            )
+            candidates = postings[0].intersection(*postings[1:])
+        else:
+            candidates = range(len(self._master))
+        master = self._master
+        rows = {row for row in candidates if title in master[row]["titlekey"]}
+        self._titles = (generation, title, rows)
+        return rows
+
+    def searchRows(self, text):
+        """Row ids matching the full text search `text`, best match first."""
+        rowids = self._rowids
+        paths = fullTextSearch(self._fields, text)
+        return [rowids[path] for path in paths if path in rowids]
+
+    def reindex(self):
+        """Rebuild the value -> row id indexes over `_master`."""
+        self._index = {field: {} for field in INDEXED_FIELDS}
+        self._rowids = {}
+        self._keys = {}
+        self._generation += 1
+        for row, record in enumerate(self._master):
+            self.indexRecord(row, record)
+
+    def indexRecord(self, row, record, fields=INDEXED_FIELDS):
+        self._rowids[record["path"]] = row
+        self._generation += 1
+        for field in fields:
+            index = self._index[field]
+            for value in index_values(record, field):
+                index.setdefault(value, set()).add(row)
+
+    def unindexRecord(self, row, record, fields=INDEXED_FIELDS):
+        self._generation += 1
+        for field in fields:
+            index = self._index[field]
+            for value in index_values(record, field):
+                index.get(value, set()).discard(row)
+
     def toggleKey(self, key):
         if key in self._headers:
             index = self._headers.index(key)
@@ -161,23 +404,29 @@ class TableModel(QAbstractTableModel):
             self.insertColumn(total, key, QModelIndex())
 
     def clearRows(self):
-        rows = self.rowCount(QModelIndex()) - 1
-        while rows >= 0:
-            self.removeRow(rows, QModelIndex())
-            rows -= 1
+        self.beginResetModel()
+        self._data = []
+        self._master = []
+        self.reindex()
+        self.endResetModel()
         self.rowCountChanged.emit()
-        return
 
     def set_data(self, data):
-        self.clearRows()
         for fullpath, record in data.items():
             record["path"] = fullpath
-            self.insertRow(self.rowCount(QModelIndex), record, QModelIndex())
+            title_key(record)
+        self.beginResetModel()
+        self._master = list(data.values())
+        self.reindex()
+        self._data = self.sortRecords(list(self._master))
+        self.endResetModel()
+        self.rowCountChanged.emit()
 
     def removeRow(self, row, parent=QModelIndex()):
         self.beginRemoveRows(parent, row, row)
         del self._data[row]
         del self._master[row]
+        self.reindex()
         self.endRemoveRows()
         self.rowCountChanged.emit()
 
@@ -185,27 +434,92 @@ class TableModel(QAbstractTableModel):
         self.beginInsertRows(parent, row, row)
         self._data.insert(row, value)
         self._master.insert(row, value)
+        self.reindex()
         self.endInsertRows()
         self.rowCountChanged.emit()
 
+    def addRecords(self, records):
+        arranged = self._last_filters is not None or self._sort is not None
+        positions = None
+        appended = []
+        for record in records:
+            title_key(record)
+            row = self._rowids.get(record["path"])
+            if row is None:
+                row = len(self._master)
+                self._master.append(record)
+                self.indexRecord(row, record)
+                self.updateSortKeys(row, record)
+                appended.append(record)
+                continue
+            old = self._master[row]
+            self.unindexRecord(row, old)
+            self.indexRecord(row, record)
+            self.updateSortKeys(row, record)
+            self._master[row] = record
+            if positions is None:
+                positions = {id(item): i for i, item in enumerate(self._data)}
+            position = positions.pop(id(old), None)
+            if position is not None:
+                positions[id(record)] = position
+                self._data[position] = record
+                self.dataChanged.emit(
+                    self.index(position, 0),
+                    self.index(position, self.columnCount(None) - 1),
+                )
+        if arranged:
+            # Filter and sort the scanned rows once, when the scan is done.
+            self._stale = self._stale or bool(records)
+        elif appended:
+            start = len(self._data)
+            self.beginInsertRows(QModelIndex(), start, start + len(appended) - 1)
+            self._data.extend(appended)
+            self.endInsertRows()
+            self.rowCountChanged.emit()
+
+    def finishRecords(self):
+        if self._stale:
+            self._stale = False
+            self.apply_filters()
+
+    def setField(self, record, key, value):
+        row = self._rowids.get(record.get("path"))
+        field = "titlekey" if key == "title" else key
+        indexed = field in self._index and row is not None
+        if indexed:
+            self.unindexRecord(row, record, [field])
+        record[key] = value
+        if key == "title":
+            title_key(record)
+        if indexed:
+            self.indexRecord(row, record, [field])
+        if row is not None:
+            self.updateSortKeys(row, record)
+        if self._sort is not None and key in [self._sort[0], "foldername"]:
+            self.relayout()
+
     def getRow(self, index):
         return self._data[index.row()]
 
     def getData(self):
-        self.clearRows()
-        data = getData(self._table)
-        for i, record in enumerate(data):
-            path, foldername, data = record
-            data = json.loads(data)
-            data["index"] = i
-            self.insertRow(self.rowCount(QModelIndex()), data, QModelIndex())
-            self.apply_filters()
-            self._view.setRowHeight(self.rowCount(QModelIndex()), self._view.rowHeight(self.rowCount(QModelIndex())))
+        records = getData(self._table)
+        for i, record in enumerate(records):
+            record["index"] = i
+            title_key(record)
+        self.beginResetModel()
+        self._master = records
+        self.reindex()
+        self._ranked = self.searchRows(self._search) if self._search else None
+        self._data = self.sortRecords(self.filtered())
+        self.endResetModel()
         self.rowCountChanged.emit()
 
     def rowCount(self, _) -> int:
         return len(self._data)
 
+    def total(self):
+        return len(self._data)
+
     def columnCount(self, _):
         return len(self._headers)
 
@@ -225,10 +539,8 @@ class TableModel(QAbstractTableModel):
 
             field = self._headers_labels[col]
             text = self._data[row][field]
-            if field == "title" and not text:
-                text = self._data[row]["foldername"].split(" (")[0]
-            elif field == "year" and not text:
-                text = self._data[row]["foldername"].split(" (")[1][:-1]
+            if field in ["title", "year"] and not text:
+                text = folder_value(self._data[row]["foldername"], field)
             if field == "pin":
                 if text:
                     if role == Qt.ItemDataRole.DecorationRole:
@@ -262,47 +574,127 @@ class TableModel(QAbstractTableModel):
                     return humanfriendly.format_size(text)
             if role == Qt.ItemDataRole.DisplayRole:
                 return text
-            if role == 100:
-                if text == "true":
-                    return True
-                elif text == "false":
-                    return False
-                try:
-                    return float(text)
-                except:
-                    return text
         return None
 
     def removeColumn(self, column, parent=QModelIndex()):
         self.beginRemoveColumns(parent, column, column)
         del self._headers[column]
         del self._headers_labels[column]
-        setSetting(self._fields + "columnfields", self._headers_labels)
+        deferSetting(self._fields + "columnfields", self._headers_labels)
         self.endRemoveColumns()
 
     def insertColumn(self, column, value, parent=QModelIndex()):
         self.beginInsertColumns(parent, column, column)
         self._headers_labels.insert(column, self._reverse[value])
         self._headers.insert(column, value)
-        setSetting(self._fields + "columnfields", self._headers_labels)
+        deferSetting(self._fields + "columnfields", self._headers_labels)
         self.endInsertColumns()
 
 
+class SqlTableModel(TableModel):
+    """A table too large to hold in memory, read from SQL a page at a time."""
 
-class SortProxyModel(QSortFilterProxyModel):
-    def __init__(self):
-        super().__init__()
-        self._random_sort = False
+    def __init__(self, table, mapping, fields=None, parent=None, view=None):
+        self._paths = None
+        self._total = 0
+        super().__init__(table, mapping, fields=fields, parent=parent, view=view)
+
+    def query(self):
+        self.beginResetModel()
+        paths = queryPaths(
+            self._table, self._last_filters, *(self._sort or (None, False))
+        )
+        if self._sort is not None and self._sort[0] == SHUFFLE:
+            # Reseed so refreshes and refilters keep one order per shuffle.
+            random.Random(self._seed).shuffle(paths)
+        self._total = len(paths)
+        self._paths = iter(paths)
+        self._stale = False
+        self._data = []
+        self._rowids = {}
+        self._data = self.fetchPage()
+        self.endResetModel()
+        self.rowCountChanged.emit()
 
-    def setRandom(self):
-        self._random_sort = not self._random_sort
+    def fetchPage(self):
+        paths = list(islice(self._paths, FETCH_ROWS))
+        if len(paths) < FETCH_ROWS:
+            self._paths = None
+        paths = [path for path in paths if path not in self._rowids]
+        records = getRecords(self._table, paths)
+        for row, record in enumerate(records, len(self._data)):
+            title_key(record)
+            self._rowids[record["path"]] = row
+        return records
+
+    def canFetchMore(self, parent):
+        return self._paths is not None
+
+    def fetchMore(self, parent):
+        records = self.fetchPage()
+        if not records:
+            return
+        start = len(self._data)
+        self.beginInsertRows(QModelIndex(), start, start + len(records) - 1)
+        self._data.extend(records)
+        self.endInsertRows()
+        self.rowCountChanged.emit()
 
-    def lessThan(self, left, right):
-        if self._random_sort:
-            return random.choice([True, False])
-        else:
-            return super().lessThan(left, right)
+    def total(self):
+        return self._total
+
+    def getData(self):
+        self.query()
+
+    def apply_filters(self, filters=None):
+        if filters is None and self._last_filters is None:
+            return
+        if filters is not None:
+            if filters == self._last_filters:
+                return
+            self._last_filters = filters
+        self.query()
+
+    def sort(self, column, order=Qt.SortOrder.AscendingOrder):
+        key = None
+        if column >= 0:
+            key = (self._headers_labels[column], order == Qt.SortOrder.DescendingOrder)
+        if key != self._sort:
+            self._sort = key
+            self.query()
+
+    def relayout(self):
+        self.query()
+
+    def addRecords(self, records):
+        for record in records:
+            row = self._rowids.get(record["path"])
+            if row is None:
+                # Where a new row belongs is only known to the query, so
+                # requery once when the scan is done.
+                self._stale = True
+                continue
+            title_key(record)
+            self._data[row] = record
+            self.dataChanged.emit(
+                self.index(row, 0), self.index(row, self.columnCount(None) - 1)
+            )
+
+    def finishRecords(self):
+        if self._stale:
+            self.query()
 
+    def setField(self, record, key, value):
+        record[key] = value
+        if key == "title":
+            title_key(record)
+
+
+class SortProxyModel(QSortFilterProxyModel):
+    def sort(self, column, order=Qt.SortOrder.AscendingOrder):
+        # The source model sorts itself; keep its rows in source order.
+        self.sourceModel().sort(column, order)
+        super().sort(-1, Qt.SortOrder.AscendingOrder)
 
 
 class TableView(QTableView):
@@ -311,9 +703,11 @@ class TableView(QTableView):
         super().__init__(parent=parent)
         self._table = table
         self._fields = fields if fields is not None else table
-        self._model = TableModel(self._table, mapping, fields=fields, view=self)
+        model = TableModel
+        if fields is None and countRows(table) > setting("sqlmodelrows"):
+            model = SqlTableModel
+        self._model = model(self._table, mapping, fields=fields, view=self)
         self._proxy_model = SortProxyModel()
-        self._proxy_model.setSortRole(100)
         self.setModel(self._proxy_model)
         self.setWordWrap(False)
         self._model.rowCountChanged.connect(self.onRowCountChanged)
@@ -353,7 +747,25 @@ class TableView(QTableView):
     def tableModel(self):
         return self._model
 
+    def neighbours(self, current):
+        rows = []
+        for offset in (-1, 1):
+            index = self.model().index(current.row() + offset, 0)
+            if index.isValid():
+                source = self.model().mapToSource(index)
+                rows.append(self._model.getRow(source))
+        return rows
+
+    def shuffle(self, seed=None):
+        self.horizontalHeader().setSortIndicator(-1, Qt.SortOrder.AscendingOrder)
+        self.tableModel().shuffle(seed)
+
     def filter(self, filters):
+        if filters and filters["fulltext"] and filters["title"]:
+            # Show the rank order; clearing the sort first leaves the
+            # layout to apply_filters, which may run off the GUI thread.
+            self.tableModel().clearSort()
+            self.sortByColumn(-1, Qt.SortOrder.AscendingOrder)
         self.tableModel().apply_filters(filters)
 
 
@@ -229,6 +229,23 @@ def tv_nfo_to_dict(content):
     return record
 
 
+def folder_value(foldername, field):
+    """The title or year shown for a row without one, read from its folder name."""
+    parts = foldername.split(" (")
+    if field == "title":
+        return parts[0]
+    return parts[1][:-1] if len(parts) > 1 else ""
+
+
+def format_report(report):
+    return (
+        f"{report['mode'].title()} refresh took {report['seconds']:.1f}s: "
+        f"{report['added']} added, {report['updated']} updated, "
+        f"{report['skipped']} unchanged, {report['missing']} missing, "
+        f"{report['episodes']} new episodes, {report['errors']} errors"
+    )
+
+
 class FlowLayout(QLayout):
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -1,15 +1,14 @@
-import os
-
 from PySide6.QtCore import *
 from PySide6.QtGui import *
 from PySide6.QtWidgets import *
 
-from mediacatalog.db import SqlDatabase
+from mediacatalog.db import ScanWorker, SqlDatabase, remove_database
 from mediacatalog.mediapage import MediaPage, TvPage
 from mediacatalog.settings import (RecentDialog, SettingsWidget,
-                                   connectionClose, setSetting, setting)
+                                   connectionClose, deferSetting,
+                                   flushSettings, setSetting, setting)
 from mediacatalog.style import style
-from mediacatalog.utils import LOCAL, geticon
+from mediacatalog.utils import LOCAL, format_report, geticon
 
 
 class Window(QMainWindow):
@@ -42,7 +41,72 @@ class Window(QMainWindow):
         self.settings.toHome.connect(self.onToHome)
         self.setCentralWidget(self.central)
         self.settings.somethingChanged.connect(self.update_tables)
+        self.settings.refreshRequested.connect(self.startScan)
+        self.pages = {
+            "movies": self.movies,
+            "tv": self.tv,
+            "ufc": self.ufc,
+            "documentaries": self.documentaries,
+        }
+        self.scanner = None
+        self.pending_scan = None
+        self.scan_progress = QProgressBar()
+        self.scan_progress.setMaximumWidth(250)
+        self.scan_progress.setFormat("Scanning %v/%m")
+        self.cancel_scan_button = QPushButton("Cancel")
+        self.cancel_scan_button.clicked.connect(self.cancelScan)
+        self.statusBar().addPermanentWidget(self.scan_progress)
+        self.statusBar().addPermanentWidget(self.cancel_scan_button)
+        self.scan_progress.setHidden(True)
+        self.cancel_scan_button.setHidden(True)
         self.resize(*self.db.setting("windowsize"))
+        self.startScan()
+
+    def startScan(self, deep=False):
+        if self.scanner is not None:
+            self.pending_scan = deep or bool(self.pending_scan)
+            return
+        flushSettings()
+        self.scanner = ScanWorker(self.db.path, deep, self)
+        self.scanner.progress.connect(self.onScanProgress)
+        self.scanner.recordsFound.connect(self.onRecordsFound)
+        self.scanner.scanFinished.connect(self.onScanFinished)
+        self.scan_progress.setRange(0, 0)
+        self.scan_progress.setHidden(False)
+        self.cancel_scan_button.setHidden(False)
+        self.scanner.start()
+
+    def cancelScan(self):
+        self.pending_scan = None
+        if self.scanner is not None:
+            self.scanner.requestInterruption()
+
+    def stopScan(self):
+        self.cancelScan()
+        if self.scanner is not None:
+            self.scanner.wait()
+
+    def onScanProgress(self, done, total):
+        self.scan_progress.setRange(0, total)
+        self.scan_progress.setValue(done)
+
+    def onRecordsFound(self, table, records):
+        self.pages[table].table.tableModel().addRecords(records)
+
+    def onScanFinished(self, report):
+        self.scanner.wait()
+        self.scanner.deleteLater()
+        self.scanner = None
+        for page in self.pages.values():
+            page.table.tableModel().finishRecords()
+        self.scan_progress.setHidden(True)
+        self.cancel_scan_button.setHidden(True)
+        self.settings.setReport(report)
+        self.statusBar().showMessage(format_report(report), 10000)
+        if self.pending_scan is not None:
+            deep = self.pending_scan
+            self.pending_scan = None
+            self.startScan(deep)
 
     def show_recent(self):
         recentdialog = RecentDialog()
@@ -55,8 +119,12 @@ class Window(QMainWindow):
         self.central.setCurrentWidget(self.settings)
 
     def onDbReset(self):
-        del self.db
+        self.stopScan()
+        self.db.close()
+        remove_database(self.db.path)
         self.db = SqlDatabase(LOCAL / "media.db")
+        self.settings.setDatabase(self.db)
+        self.startScan()
 
     def update_tables(self):
         for page in [self.movies, self.tv, self.ufc, self.documentaries]:
@@ -70,8 +138,14 @@ class Window(QMainWindow):
     def openSettings(self):
         self.central.setCurrentWidget(self.settings)
 
+    def resizeEvent(self, event):
+        deferSetting("windowsize", list(self.size().toTuple()))
+        super().resizeEvent(event)
+
     def closeEvent(self, event):
-        self.setSetting("windowsize", list(self.size().toTuple()))
+        self.stopScan()
+        deferSetting("windowsize", list(self.size().toTuple()))
+        flushSettings()
         super().closeEvent(event)
 
 
@@ -94,7 +168,7 @@ def execute():
             pass
 
         connectionClose()
-        os.remove(LOCAL / "media.db")
+        remove_database(LOCAL / "media.db")
         window = Window()
         for key, value in zip(["tv", "movies", "ufc", "documentaries"], temp):
             setSetting(key, value)